@@ -1,14 +1,44 @@
+from dotenv import load_dotenv
+
+# Load .env before importing app modules; they read their settings at import time
+load_dotenv()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from database import init_db
+from contextlib import asynccontextmanager
+from database import init_db, async_engine
 from routers import upload, chat, nango
+from services.ingestion import ingestion_queue
+from services.extraction import extractor
+from services.nango import nango_service
+from services.summarizer import conversation_summarizer
+from services.chat_stream import chat_streams
+from services.vector_index import ensure_index
+from services.vector_store import vector_store, VECTOR_BACKEND
+import threading
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background workers that drain the ingestion job table
+    ingestion_queue.start()
+    if VECTOR_BACKEND == "pgvector":
+        # CREATE INDEX CONCURRENTLY can take a while on a large table; don't block startup
+        threading.Thread(target=ensure_index, name="vector-index-build", daemon=True).start()
+    yield
+    ingestion_queue.stop()
+    extractor.shutdown()
+    # Persist the in-process ANN graph (no-op for pgvector)
+    vector_store.close()
+    await chat_streams.aclose()
+    await conversation_summarizer.aclose()
+    await nango_service.aclose()
+    await async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Database initialization
 init_db()
@@ -25,6 +55,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets browser clients read the id they need to resume a dropped chat stream,
+    # and whether a resumed reply was cut short
+    expose_headers=["X-Stream-Id", "X-Stream-Status"],
 )
 
 # Static Files (Uploads)
@@ -44,3 +77,8 @@ def read_root():
 @app.get("/api/health")
 def health_check():
     return {"status": "ok"}
+
+@app.get("/api/health/search-cache")
+def search_cache_stats():
+    # Query-embedding and result cache counters for this API process
+    return vector_store.search_cache.stats()
@@ -1,34 +1,31 @@
 from fastapi import APIRouter
 from fastapi.responses import StreamingResponse
+import asyncio
 import json
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from typing import List
-from services.agent import agent, model
-from pydantic_ai import Agent
 from database import (
     get_db,
+    get_async_db,
+    AsyncSessionLocal,
     Chat as ChatModel,
     Message as MessageModel
 )
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import desc
-from fastapi import Depends, HTTPException
+from fastapi import Depends, Header, HTTPException
 import uuid
-from pydantic_ai.messages import (
-    ModelRequest,
-    ModelResponse,
-    TextPart,
-    UserPromptPart
-)
 from services.vector_store import vector_store
-from prompts.industries import INDUSTRY_PROMPTS
-from .utils import get_latest_valid_extraction
-from tools.query_data import get_banking_field, BankingData
-from tools.google_drive import export_to_drive, DriveDeps
+from services.reranker import reranker, RERANK_CANDIDATES, RERANK_TOP_K
+from .utils import get_latest_valid_extraction, save_extraction, attach_referenced_files, get_chat_file_ids
+from schemas.banking import BankingExtraction
+from services.agent_registry import agent_registry, select_agent, build_deps, EXTRACTION
 from services.nango import nango_service
-
-from typing import Dict, Any
-from dataclasses import dataclass
+from services.chat_history import load_history, window, to_model_messages, count_tokens, token_meta
+from services.summarizer import conversation_summarizer
+from services.section_extraction import section_extractor, STRUCTURED_EXTRACTION_MODE
+from services.chat_stream import ContentEncoder, ChatStream, chat_streams, status_event, END_EVENT, STREAM_MODES, STREAM_FLUSH_INTERVAL
 
 
 router = APIRouter()
@@ -45,9 +42,28 @@ class Message(BaseModel):
 
 
 class ChatRequest(BaseModel):
-    messages: List[Message]
+    # The new user message; earlier turns are loaded from the chat's stored messages
+    message: str | Message | None = None
+    # The web client's chat library posts a list here holding just the new message;
+    # older clients send the whole conversation. Only the last entry is used,
+    # plus the rest as history when the chat has nothing stored yet.
+    messages: List[Message] | None = None
     industry: str | None = None
     chat_id: str | None = None
+    # 'snapshot' or 'delta'; defaults to CHAT_STREAM_MODE
+    stream_mode: str | None = None
+
+
+def message_text(msg: Message | str | None) -> str:
+    if msg is None:
+        return ""
+    if isinstance(msg, str):
+        return msg
+    if isinstance(msg.content, str):
+        return msg.content
+    if msg.content is None:
+        return ""
+    return "\n".join([p.content for p in msg.content if p.type == 'text'])
 
 
 @router.get("/chats")
@@ -87,6 +103,20 @@ def get_chat(chat_id: str, db: Session = Depends(get_db)):
         })
     return formatted
 
+@router.get("/chats/{chat_id}/summary")
+def get_chat_summary(chat_id: str, db: Session = Depends(get_db)):
+    chat = db.query(ChatModel).filter(ChatModel.id == chat_id).first()
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    return {
+        "summary": chat.summary,
+        "summary_through": chat.summary_through,
+        "summary_tokens": chat.summary_tokens or 0,
+        "summarized_messages": chat.summarized_messages or 0,
+        "summarized_tokens": chat.summarized_tokens or 0,
+        "tokens_saved": chat.tokens_saved or 0,
+    }
+
 @router.delete("/chats/{chat_id}")
 def delete_chat(chat_id: str, db: Session = Depends(get_db)):
     chat = db.query(ChatModel).filter(ChatModel.id == chat_id).first()
@@ -97,53 +127,83 @@ def delete_chat(chat_id: str, db: Session = Depends(get_db)):
     return {"status": "success", "id": chat_id}
 
 @router.post("/chat")
-async def chat_endpoint(request: ChatRequest, db: Session = Depends(get_db)):
+async def chat_endpoint(request: ChatRequest, db: AsyncSession = Depends(get_async_db)):
+    # Everything below runs on the event loop: DB access is awaited (asyncpg), and blocking
+    # or CPU-heavy work (embedding, re-ranking) is pushed to threads so other streams keep flowing.
+
+    # Resolve the Google Drive token (Nango) while we do the DB and retrieval work below;
+    # it's served from cache once warm, so this is normally instant
+    nango_user_id = "test-user-1"
+    drive_token_task = asyncio.create_task(nango_service.get_access_token(nango_user_id, "google-drive"))
+
+    if request.message is not None:
+        last_content = message_text(request.message)
+    elif request.messages:
+        last_content = message_text(request.messages[-1])
+    else:
+        drive_token_task.cancel()
+        raise HTTPException(status_code=400, detail="Request must include 'message'")
+    if request.stream_mode is not None and request.stream_mode not in STREAM_MODES:
+        drive_token_task.cancel()
+        raise HTTPException(status_code=400, detail=f"stream_mode must be one of {list(STREAM_MODES)}")
+
     # Persist Chat Session
     chat_id = request.chat_id
     if not chat_id:
         chat_id = str(uuid.uuid4())
     
-    chat_session = db.query(ChatModel).filter(ChatModel.id == chat_id).first()
+    chat_session = await db.get(ChatModel, chat_id)
     if not chat_session:
         chat_session = ChatModel(id=chat_id, title="New Chat")
         db.add(chat_session)
-        db.commit()
-        db.refresh(chat_session)
-    
+        await db.commit()
+        message_history = []
+    else:
+        # Build Message History
+        # Running summary of older turns + stored turns after it (before this message is saved),
+        # newest ones kept within HISTORY_TOKEN_BUDGET
+        message_history = await load_history(db, chat_session)
+
+    # Compared with sending the turns the summary covers verbatim
+    summary_tokens_saved = 0
+    if chat_session.summary:
+        summary_tokens_saved = max((chat_session.summarized_tokens or 0) - (chat_session.summary_tokens or 0), 0)
+
+    if not message_history and request.messages and len(request.messages) > 1:
+        # Nothing stored for this chat yet: fall back to the history the client sent
+        client_rows = []
+        for msg in request.messages[:-1]:
+            content = message_text(msg)
+            client_rows.append((msg.role, content, count_tokens(content)))
+        message_history = to_model_messages(window(client_rows))
+
     # Save User Message
-    last_msg_obj = request.messages[-1]
-    last_content_str = ""
-    if isinstance(last_msg_obj.content, str):
-        last_content_str = last_msg_obj.content
-    elif isinstance(last_msg_obj.content, list):
-         last_content_str = "\n".join([p.content for p in last_msg_obj.content if p.type == 'text'])
-    
     user_msg_id = str(uuid.uuid4())
     user_message = MessageModel(
         id=user_msg_id,
         chat_id=chat_id,
         role="user",
-        content=last_content_str
+        content=last_content,
+        meta=token_meta(last_content)
     )
     db.add(user_message)
-    db.commit()
-
-    # ... (Prompt construction logic remains same) ...
-    # We need to preserve the setup code (retrieval, history building)
-    
-    # Flatten last message content
-    last_msg = request.messages[-1]
-    last_content = ""
-    if isinstance(last_msg.content, str):
-        last_content = last_msg.content
-    elif last_msg.content is None:
-        last_content = ""
-    else:
-        last_content = "\n".join([p.content for p in last_msg.content if p.type == 'text'])
+    await db.commit()
 
     # RAG Retrieval
-    # We search the vector store for chunks relevant to the latest user query
-    context_chunks = vector_store.search(last_content, k=5)
+    # We search the vector store for chunks relevant to the latest user query,
+    # scoped to the files attached to this chat
+    newly_attached = await attach_referenced_files(db, chat_id, last_content)
+    if newly_attached:
+        await asyncio.to_thread(vector_store.assign_chat, newly_attached, chat_id)
+    chat_file_ids = await get_chat_file_ids(db, chat_id)
+    context_chunks = []
+    if chat_file_ids:
+        if reranker:
+            # Over-fetch, then keep only the few chunks the cross-encoder ranks best
+            candidates = await vector_store.asearch(last_content, k=RERANK_CANDIDATES, file_ids=chat_file_ids)
+            context_chunks = await asyncio.to_thread(reranker.rerank, last_content, candidates, RERANK_TOP_K)
+        else:
+            context_chunks = await vector_store.asearch(last_content, k=5, file_ids=chat_file_ids)
     
     context_text = ""
     if context_chunks:
@@ -151,7 +211,7 @@ async def chat_endpoint(request: ChatRequest, db: Session = Depends(get_db)):
         for i, chunk in enumerate(context_chunks):
             # Include filename if available in metadata
             source = chunk.get("filename", "Unknown File")
-            context_text += f"\n--- Chunk {i+1} from {source} (Score: {chunk.get('score', 0):.2f}) ---\n{chunk['text']}\n"
+            context_text += f"\n--- Chunk {i+1} from {source} (Score: {chunk.get('rerank_score', chunk.get('score', 0)):.2f}) ---\n{chunk['text']}\n"
     
     if context_text:
         full_prompt = f"{context_text}\n\nUser Query: {last_content}"
@@ -159,153 +219,79 @@ async def chat_endpoint(request: ChatRequest, db: Session = Depends(get_db)):
     else:
         full_prompt = last_content
 
-    # Build Message History
-    message_history = []
-    # Iterate over all messages except the last one (which is the new prompt)
-    for msg in request.messages[:-1]:
-        content_str = ""
-        if isinstance(msg.content, str):
-             content_str = msg.content
-        elif isinstance(msg.content, list):
-             content_str = "\n".join([p.content for p in msg.content if p.type == 'text'])
-        
-        if not content_str: 
-             continue
-
-        if msg.role == 'user':
-            message_history.append(ModelRequest(parts=[UserPromptPart(content=content_str)]))
-        elif msg.role == 'assistant':
-            message_history.append(ModelResponse(parts=[TextPart(content=content_str)]))
-
-    # Dynamic Agent Configuration
-    active_agent = agent
-    agent_deps = None
-    
     # Check for existing extraction first
-    extracted_data = get_latest_valid_extraction(db, chat_id)
+    extracted_data = await get_latest_valid_extraction(db, chat_id)
     print(f"DEBUG: Existing extraction found: {extracted_data is not None}")
-    
     print(f"DEBUG INCOMING REQUEST: Industry='{request.industry}'")
-    if request.industry:
-        industry_prompt = INDUSTRY_PROMPTS.get(request.industry)
-        if industry_prompt and model:
-            try:
-                # Base system prompt with industry context
-                # We append instructions about "Conversational vs Extraction" behavior
-                system_prompt = (
-                    f"{industry_prompt}\n\n"
-                    "IMPORTANT: You are in Hybrid Mode. "
-                    "If the user asks a conversational question, reply with text. "
-                    "If the user asks to extract data, analyze the document, or get the summary, return valid JSON matching the schema."
-                )
 
-                if request.industry == "banking":
-                    from schemas.banking import BankingExtraction
-                    
-                    if extracted_data:
-                         # Hybrid Query Mode
-                         # User has already extracted data. We should use the tool to query it.
-                         query_system_prompt = (
-                             "You are a helpful banking assistant with access to previously extracted data. "
-                             "You generally have two modes:\n"
-                             "1. FIELD QUERY: If the user asks for a specific value (e.g. 'What is the borrower name?', 'How much is the loan?'), "
-                             "you MUST use the `get_banking_field` tool to get the exact value. Do not guess.\n"
-                             "2. ANALYSIS/SUMMARY: If the user asks for a summary, analysis, or general question, "
-                             "you should answer based on the full context you have. You do not need to call the tool for every field if summarizing everything, "
-                             "but you should use the tool if you need to be precise about specific numbers.\n\n"
-                             "If the user asks to UPDATE or RE-EXTRACT data, you should refuse and say you are in query mode, "
-                             "or (if implemented) trigger a re-extraction flow (not active yet)."
-                         )
-                         active_agent = Agent(model, system_prompt=query_system_prompt, tools=[get_banking_field], deps_type=BankingData)
-                         agent_deps = BankingData(data=extracted_data)
-                         print(f"Switched to Query Agent (Data Available)")
-                         print(f"Switched to Query Agent (Data Available)")
-                    else:
-                        # Schema-enforced Mode (First time extraction)
-                        # We use a minimal system prompt that forces tool usage and relies on the Pydantic model for schema definition.
-                        # We avoid feeding the text-based schema from INDUSTRY_PROMPTS as it confuses the model.
-                        refined_system_prompt = (
-                             "You are a strict data extraction engine. You are forbidden from speaking.\n"
-                             "You must ONLY call the `BankingExtraction` tool with data from the document.\n"
-                             "If you cannot extract data, call the tool with null values.\n"
-                             "Outputting text or markdown is a system violation."
-                        )
-                        active_agent = Agent(model, system_prompt=refined_system_prompt)
-                        print(f"Switched to Extraction Agent (Schema: {request.industry})")
-                else:
-                    # Prompt-only Mode (for now, until other schemas are defined)
-                    # For other industries, we just inject the prompt. 
-                    active_agent = Agent(model, system_prompt=industry_prompt)
-                    print(f"Switched to Extraction Agent (Prompt: {request.industry})")
-            
-            except Exception as e:
-                print(f"Failed to configure agent: {e}")
+    # Check for Export Capability (Nango)
+    # Token for 'google-drive', looked up at the start of the request
+    drive_token = await drive_token_task
+    if not drive_token:
+        print(f"DEBUG: No 'google-drive' connection found for user {nango_user_id}")
 
+    # Dynamic Agent Configuration
+    # Agents are built once per (mode, industry, toolset) and shared; only deps are per request
+    agent_mode, agent_tools = select_agent(request.industry, extracted_data, drive_token)
+    active_agent = agent_registry.get(agent_mode, request.industry, agent_tools)
+    agent_deps = build_deps(agent_mode, agent_tools, extracted_data, drive_token)
+    print(f"Using {agent_mode} agent (tools: {sorted(agent_tools)})")
+
+    # The stream id is also the id of the assistant message, so a client that reconnects
+    # after the stream has been dropped from memory can still fetch the stored answer
+    stream_id = str(uuid.uuid4())
+    encoder = ContentEncoder(request.stream_mode)
+
+    async def save_reply(content: str, extraction: dict | None = None, status: str | None = None):
+        # Save Assistant Response
+        # The request's session is closed once streaming starts, so use a fresh one
+        meta = token_meta(content)
+        if status:
+            meta["status"] = status
+        async with AsyncSessionLocal() as db_stream:
+            try:
+                asst_msg = MessageModel(
+                    id=stream_id,
+                    chat_id=chat_id,
+                    role="assistant",
+                    content=content,
+                    meta=meta
+                )
+                db_stream.add(asst_msg)
 
+                # Update Chat Title if it's new and has content (First turn)
+                # Maybe summarize later? For now just keep it "New Chat" or update with first few words.
+                # Simplistic title update:
+                chat_rec = await db_stream.get(ChatModel, chat_id)
+                if chat_rec and summary_tokens_saved:
+                    chat_rec.tokens_saved = (chat_rec.tokens_saved or 0) + summary_tokens_saved
+                if chat_rec and chat_rec.title == "New Chat":
+                    # Use first 30 chars of user query or assistant response? User query is better.
+                    # reusing last_content from closure
+                    new_title = last_content[:30] + "..." if len(last_content) > 30 else last_content
+                    chat_rec.title = new_title
 
-    # Check for Export Capability (Nango)
-    # This logic runs if we haven't already locked into a strict extraction or query agent, OR we can enhance the current agent.
-    # For now, let's allow export ONLY if we aren't in strict extraction mode. 
-    # If the user asks "Export this to drive", we need the tool.
-    
-    # Let's try to fetch a token for 'google-drive'.
-    nango_user_id = "test-user-1" 
-    
-    # 1. Lookup the valid connection ID for this user
-    nango_connection_id = nango_service.get_connection_for_user(nango_user_id, "google-drive")
-    
-    drive_token = None
-    if nango_connection_id:
-        print(f"DEBUG: Found connection ID {nango_connection_id} for user {nango_user_id}")
-        drive_token = nango_service.get_connection_token(nango_connection_id, "google-drive")
-    else:
-        print(f"DEBUG: No 'google-drive' connection found for user {nango_user_id}")
-    
-    if drive_token and not (request.industry == "banking" and not extracted_data):
-        # We have a drive token and we are NOT in strict extraction mode.
-        # We can enable the Drive Export tool.
-        
-        # If we already have an agent (e.g. Query Agent), we need to add the tool to it?
-        # Pydantic AI agents are immutableish. We might need to recreate or use a fresh one.
-        # Actually, if we are in Query Mode, we used `tools=[get_banking_field]`. We should add `export_to_drive`.
-        
-        # Redefine agent if we are in Query Mode to include both
-        if request.industry == "banking" and extracted_data:
-             # Query + Export
-             query_system_prompt = (
-                 "You are a helpful banking assistant with access to previously extracted data. "
-                 "You generally have two modes:\n"
-                 "1. FIELD QUERY: If the user asks for a specific value (e.g. 'What is the borrower name?', 'How much is the loan?'), "
-                 "you MUST use the `get_banking_field` tool to get the exact value. Do not guess.\n"
-                 "2. ANALYSIS/SUMMARY: If the user asks for a summary, analysis, or general question, "
-                 "you should answer based on the full context you have.\n"
-                 "3. EXPORT: If the user asks to export data to Google Drive, use the `export_to_drive` tool.\n"
-             )
-             
-             # We need a Combined Dependency class or pass a tuple?
-             # Pydantic AI supports single dependency object usually. We can create a CombinedDeps.
-             @dataclass
-             class CombinedDeps:
-                 data: Dict[str, Any]
-                 access_token: str
-                 
-             active_agent = Agent(model, system_prompt=query_system_prompt, tools=[get_banking_field, export_to_drive], deps_type=CombinedDeps)
-             agent_deps = CombinedDeps(data=extracted_data, access_token=drive_token)
-             print("Enabled Query + Drive Export Agent")
-             
-        elif not request.industry:
-             # General Chat Mode + Export
-             export_system_prompt = (
-                 "You are a helpful assistant. "
-                 "If the user asks to export a file or content to Google Drive, use the `export_to_drive` tool."
-             )
-             active_agent = Agent(model, system_prompt=export_system_prompt, tools=[export_to_drive], deps_type=DriveDeps)
-             agent_deps = DriveDeps(access_token=drive_token)
-             print("Enabled General Drive Export Agent")
+                await db_stream.commit()
+            except Exception as e:
+                print(f"Failed to save assistant message: {e}")
+                return
+
+            if extraction is not None:
+                # Own transaction, after the reply is committed: a failure here must not lose the message
+                try:
+                    version = await save_extraction(db_stream, chat_id, stream_id, request.industry, extraction)
+                    await db_stream.commit()
+                    print(f"Stored extraction v{version} for chat {chat_id}")
+                except Exception as e:
+                    await db_stream.rollback()
+                    print(f"Failed to save extraction for chat {chat_id}: {e}")
 
     async def stream_generator():
         yield "event: start\ndata: \n\n"
         accumulated_response = ""
+        reply_complete = False
+        # Schema-validated extraction produced by this turn, persisted with the reply
+        validated_extraction = None
         
         try:
              # Send custom chunk with chat_id so client knows it
@@ -321,7 +307,7 @@ async def chat_endpoint(request: ChatRequest, db: Session = Depends(get_db)):
 
             # Determine if we are in STRICT Extraction Mode (Banking)
             # Only if banking industry AND no existing data (or explicit re-extraction requested, not handled yet)
-            is_strict_extraction = (request.industry == "banking" and not extracted_data)
+            is_strict_extraction = (agent_mode == EXTRACTION)
 
             if is_strict_extraction:
                 # ... (Existing strict extraction logic) ... 
@@ -332,67 +318,72 @@ async def chat_endpoint(request: ChatRequest, db: Session = Depends(get_db)):
                 # We implement a retry loop to force the model to use the tool if it refuses (returns text).
                 print("Executing Strict Extraction...")
                 
-                max_retries = 2
-                attempt = 0
                 extraction_model = None
+                if STRUCTURED_EXTRACTION_MODE == "sections" and chat_file_ids:
+                    # One schema-scoped call per section, concurrently, each with its own retrieval
+                    print("Extracting sections concurrently...")
+                    extraction_model = await section_extractor.extract(last_content, chat_file_ids)
+                else:
+                    max_retries = 2
+                    attempt = 0
                 
-                # First attempt
-                from schemas.banking import BankingExtraction
-                result = await active_agent.run(full_prompt, message_history=message_history, output_type=BankingExtraction)
+                    # First attempt (the extraction agent's output type is BankingExtraction)
+                    result = await active_agent.run(full_prompt, message_history=message_history)
                 
-                while attempt < max_retries:
-                    result_data = result.output # 'output' is the attribute for result data
+                    while attempt < max_retries:
+                        result_data = result.output # 'output' is the attribute for result data
                     
-                    if not isinstance(result_data, str):
-                        # Success: We got a Pydantic model
-                        extraction_model = result_data
-                        break
+                        if not isinstance(result_data, str):
+                            # Success: We got a Pydantic model
+                            extraction_model = result_data
+                            break
                     
-                    # Failure: Model returned text. Retry.
-                    print(f"Extraction Failed (Attempt {attempt+1}/{max_retries}): Model output text: {result_data[:50]}...")
-                    attempt += 1
+                        # Failure: Model returned text. Retry.
+                        print(f"Extraction Failed (Attempt {attempt+1}/{max_retries}): Model output text: {result_data[:50]}...")
+                        attempt += 1
                     
-                    # Feed the refusal back to the model
-                    retry_prompt = "Server Error: You replied with text. You MUST call the `BankingExtraction` tool to return data. Do not speak."
-                    result = await active_agent.run(retry_prompt, message_history=result.new_messages(), output_type=BankingExtraction)
+                        # Feed the refusal back to the model
+                        retry_prompt = "Server Error: You replied with text. You MUST call the `BankingExtraction` tool to return data. Do not speak."
+                        result = await active_agent.run(retry_prompt, message_history=result.new_messages())
                 
-                # Logic Retry: Confidence-based Refinement using `confidence_report`
-                if extraction_model:
-                     print("Analyzing confidence report...")
-                     low_confidence_items = []
+                    # Logic Retry: Confidence-based Refinement using `confidence_report`
+                    if extraction_model:
+                         print("Analyzing confidence report...")
+                         low_confidence_items = []
                      
-                     # Check the explicitly reported confidence scores
-                     if hasattr(extraction_model, 'confidence_report') and extraction_model.confidence_report:
-                         for field, confidence in extraction_model.confidence_report.items():
-                             # Trigger retry for anything less than perfect certainty to prove it works
-                             if confidence < 0.95:
-                                 low_confidence_items.append(f"{field} (Confidence: {confidence})")
+                         # Check the explicitly reported confidence scores
+                         if hasattr(extraction_model, 'confidence_report') and extraction_model.confidence_report:
+                             for field, confidence in extraction_model.confidence_report.items():
+                                 # Trigger retry for anything less than perfect certainty to prove it works
+                                 if confidence < 0.95:
+                                     low_confidence_items.append(f"{field} (Confidence: {confidence})")
                      
-                     # Also check for nulls in critical sections (optional, but good for robustness)
-                     # For now, we rely on the model self-reporting via confidence_report, or we can add a quick check.
-                     # Let's stick to the plan: use the report.
+                         # Also check for nulls in critical sections (optional, but good for robustness)
+                         # For now, we rely on the model self-reporting via confidence_report, or we can add a quick check.
+                         # Let's stick to the plan: use the report.
                      
-                     if low_confidence_items:
-                         print(f"Found {len(low_confidence_items)} low confidence items. Performing Refinement...")
-                         refinement_prompt = (
-                             f"You reported low confidence for the following fields: {'; '.join(low_confidence_items)}. "
-                             "Update the fields and the confidence report. "
-                             "Return the updated complete object."
-                         )
+                         if low_confidence_items:
+                             print(f"Found {len(low_confidence_items)} low confidence items. Performing Refinement...")
+                             refinement_prompt = (
+                                 f"You reported low confidence for the following fields: {'; '.join(low_confidence_items)}. "
+                                 "Update the fields and the confidence report. "
+                                 "Return the updated complete object."
+                             )
                          
-                         refinement_result = await active_agent.run(refinement_prompt, message_history=result.new_messages(), output_type=BankingExtraction)
+                             refinement_result = await active_agent.run(refinement_prompt, message_history=result.new_messages())
                          
-                         if not isinstance(refinement_result.output, str):
-                              extraction_model = refinement_result.output
-                              print("Refinement successful.")
+                             if not isinstance(refinement_result.output, str):
+                                  extraction_model = refinement_result.output
+                                  print("Refinement successful.")
+                             else:
+                                  print("Refinement returned text/failure, keeping original.")
                          else:
-                              print("Refinement returned text/failure, keeping original.")
-                     else:
-                         print("No low confidence issues reported. Skipping refinement.")
+                             print("No low confidence issues reported. Skipping refinement.")
 
                 # Final check
                 if extraction_model:
                      json_str = extraction_model.model_dump_json(indent=2)
+                     validated_extraction = extraction_model.model_dump(mode="json")
                 else:
                     # Final fallback if retries failed
                     result_data = result.output
@@ -401,91 +392,116 @@ async def chat_endpoint(request: ChatRequest, db: Session = Depends(get_db)):
                             clean_json = result_data.replace("```json", "").replace("```", "").strip()
                             json.loads(clean_json)
                             json_str = clean_json
+                            try:
+                                validated_extraction = BankingExtraction.model_validate_json(clean_json).model_dump(mode="json")
+                            except ValidationError:
+                                print("Fallback JSON does not match the schema; not storing it as an extraction.")
                          except:
                             json_str = json.dumps({"error": "Failed to extract structured data after retries", "raw_response": result_data}, indent=2)
                     else:
                         # Should not happen if logic is correct
                         json_str = result.output.model_dump_json(indent=2)
 
-                accumulated_response = f"```json\n{json_str}\n```"
-
                 # Send as a single Markdown Code Block
-                markdown_json = accumulated_response
-                chunk_obj = {
-                    "type": "content",
-                    "delta": markdown_json,
-                    "content": markdown_json
-                }
-                yield f"data: {json.dumps(chunk_obj)}\n\n"
+                yield encoder.delta(f"```json\n{json_str}\n```")
 
             else:
                 # Standard Chat Streaming (Text, unstructured, or Query Tool)
                 async with active_agent.run_stream(full_prompt, message_history=message_history, deps=agent_deps) as result:
-                    previous_text = ""
-                    async for chunk in result.stream():
-                        if isinstance(chunk, str):
-                            # PydanticAI streams snapshots (full text so far)
-                            snapshot = chunk
-                            
-                            # Calculate delta for the frontend (if needed)
-                            if snapshot.startswith(previous_text):
-                                delta = snapshot[len(previous_text):]
-                            else:
-                                # Fallback if snapshot doesn't start with previous (shouldn't happen in append-only)
-                                delta = snapshot
-                            
-                            chunk_obj = {
-                                "type": "content", 
-                                "delta": delta,
-                                "content": snapshot
-                            }
-                            
-                            previous_text = snapshot
-                            yield f"data: {json.dumps(chunk_obj)}\n\n"
-                    
-                    accumulated_response = previous_text # Capture full text
-
-            # Save Assistant Response
-            # We must use a new session or ensure thread safety? 
-            # safe enough to use `SessionLocal()` here effectively.
-            from database import SessionLocal
-            db_sync = SessionLocal()
-            try:
-                asst_msg = MessageModel(
-                    id=str(uuid.uuid4()),
-                    chat_id=chat_id,
-                    role="assistant",
-                    content=accumulated_response
-                )
-                db_sync.add(asst_msg)
-                
-                # Update Chat Title if it's new and has content (First turn)
-                # Maybe summarize later? For now just keep it "New Chat" or update with first few words.
-                # Simplistic title update:
-                chat_rec = db_sync.query(ChatModel).filter(ChatModel.id == chat_id).first()
-                if chat_rec and chat_rec.title == "New Chat":
-                    # Use first 30 chars of user query or assistant response? User query is better.
-                    # reusing last_content_str from closure
-                    new_title = last_content_str[:30] + "..." if len(last_content_str) > 30 else last_content_str
-                    chat_rec.title = new_title
-                
-                db_sync.commit()
-            except Exception as e:
-                print(f"Failed to save assistant message: {e}")
-            finally:
-                db_sync.close()
-
+                    # Native text deltas, coalesced over STREAM_FLUSH_INTERVAL
+                    async for delta in result.stream_text(delta=True, debounce_by=STREAM_FLUSH_INTERVAL or None):
+                        if delta:
+                            yield encoder.delta(delta)
+
+            accumulated_response = encoder.text
+            final_event = encoder.final()
+            if final_event:
+                yield final_event
+
+            # Generation is over; a disconnect from here on must not cut the save short
+            reply_complete = True
+            await asyncio.shield(save_reply(accumulated_response, validated_extraction))
+
+            # Compact older turns off the request path once the chat has grown past the threshold
+            conversation_summarizer.schedule(chat_id)
+
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client went away (see STREAM_DISCONNECT_GRACE): the agent run and any pending
+            # extraction retries were cancelled with us; keep whatever was generated
+            if not reply_complete:
+                print(f"Chat stream {stream_id} cancelled with {len(encoder.text)} chars generated")
+                await save_reply(encoder.text, status="cancelled")
+            raise
         except Exception as e:
             error_msg = f"Error: {str(e)}"
             print(f"AI Error: {e}")
-            error_obj = {
-                "type": "content",
-                "delta": error_msg,
-                "content": error_msg 
-            }
-            yield f"data: {json.dumps(error_obj)}\n\n"
+            yield encoder.error(error_msg)
             
         yield "event: end\ndata: \n\n"
     
-    return StreamingResponse(stream_generator(), media_type="text/event-stream")
+    # Generation runs as its own task; this response (and any reconnect) just follows its events
+    stream = chat_streams.start(ChatStream(stream_id, chat_id, encoder), stream_generator())
+    return StreamingResponse(
+        stream.follow(),
+        media_type="text/event-stream",
+        headers={"X-Stream-Id": stream_id}
+    )
+
+
+@router.get("/chat/streams/{stream_id}")
+async def resume_chat_stream(
+    stream_id: str,
+    last_event_id: int | None = None,
+    stream_mode: str | None = None,
+    last_event_id_header: str | None = Header(default=None, alias="Last-Event-ID"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Re-attach to a chat stream. Events after Last-Event-ID (header, or ?last_event_id=
+    for fetch-based clients) are replayed, then followed live. Once the stream is no
+    longer held in memory, the persisted assistant message is sent instead.
+    """
+    cursor = last_event_id
+    if cursor is None and last_event_id_header:
+        try:
+            cursor = int(last_event_id_header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+    stream = chat_streams.get(stream_id)
+    if stream is not None:
+        headers = {"X-Stream-Id": stream_id}
+        if stream.done:
+            headers["X-Stream-Status"] = stream.status
+        return StreamingResponse(
+            stream.follow(cursor or 0),
+            media_type="text/event-stream",
+            headers=headers
+        )
+
+    message = await db.get(MessageModel, stream_id)
+    if message is None or message.role != "assistant":
+        raise HTTPException(status_code=404, detail="Stream not found")
+    if stream_mode is not None and stream_mode not in STREAM_MODES:
+        raise HTTPException(status_code=400, detail=f"stream_mode must be one of {list(STREAM_MODES)}")
+
+    # 'cancelled' when the client went away before the reply finished
+    status = (message.meta or {}).get("status", "complete")
+
+    async def persisted_generator():
+        encoder = ContentEncoder(stream_mode)
+        yield "event: start\ndata: \n\n"
+        yield encoder.render(encoder.delta(message.content or ""))
+        final_event = encoder.final()
+        if final_event:
+            yield final_event
+        if status != "complete":
+            yield status_event(status)
+        yield END_EVENT
+
+    return StreamingResponse(
+        persisted_generator(),
+        media_type="text/event-stream",
+        headers={"X-Stream-Id": stream_id, "X-Stream-Status": status}
+    )
 
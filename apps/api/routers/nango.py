@@ -10,9 +10,9 @@ class ConnectTokenResponse(BaseModel):
 
 
 @router.get("/connect-token", response_model=ConnectTokenResponse)
-def get_connect_token(user_id: str = "test-user-1"):
+async def get_connect_token(user_id: str = "test-user-1"):
     try:
-        token = nango_service.create_connect_session(user_id)
+        token = await nango_service.create_connect_session(user_id)
         if not token:
             raise Exception("Token is None (check server logs for API error)")
         return {"token": token}
@@ -1,21 +1,39 @@
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form
 from sqlalchemy.orm import Session
-from database import get_db, File as FileModel
-import shutil
+from database import get_db, File as FileModel, IngestionJob
+import hashlib
 import os
 import uuid
-from services.extraction import extractor
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from services.vector_store import vector_store
+from services.ingestion import ingestion_queue
 
 router = APIRouter()
 
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+COPY_CHUNK_SIZE = 1024 * 1024
 
+
+def find_canonical_file(db: Session, content_hash: str):
+    """
+    Returns the original upload with identical content whose blob still exists
+    and whose indexing hasn't failed, or None.
+    """
+    candidates = db.query(FileModel).outerjoin(IngestionJob).filter(
+        FileModel.content_hash == content_hash,
+        FileModel.duplicate_of.is_(None),
+        (IngestionJob.status.is_(None)) | (IngestionJob.status != "failed")
+    ).order_by(FileModel.uploaded_at).all()
+
+    for candidate in candidates:
+        if os.path.exists(candidate.file_path):
+            return candidate
+    return None
+
+
+# Plain `def` so FastAPI runs the disk copy in its threadpool instead of on the event loop
 @router.post("/upload")
-async def upload_file(
+def upload_file(
     file: UploadFile = File(...),
     chat_id: str = Form(None),  # Optional chat_id linkage
     db: Session = Depends(get_db)
@@ -25,65 +43,110 @@ async def upload_file(
     safe_filename = f"{valid_id}{file_extension}"
     file_path = os.path.join(UPLOAD_DIR, safe_filename)
 
+    # Hash while copying so deduplication costs no extra pass over the file
+    sha256 = hashlib.sha256()
+    file_size = 0
     try:
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            while chunk := file.file.read(COPY_CHUNK_SIZE):
+                sha256.update(chunk)
+                buffer.write(chunk)
+                file_size += len(chunk)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Could not save file: {str(e)}"
         )
 
+    content_hash = sha256.hexdigest()
+    canonical = find_canonical_file(db, content_hash)
+    if canonical:
+        # Identical content was uploaded before: reuse its blob and chunks
+        os.remove(file_path)
+        file_path = canonical.file_path
+        safe_filename = os.path.basename(file_path)
+
     # Create DB entry
     db_file = FileModel(
         id=valid_id,
         chat_id=chat_id,
         filename=file.filename,
         file_path=file_path,
-        file_size=0  # TODO: Get size
+        file_size=file_size,
+        content_hash=content_hash,
+        duplicate_of=canonical.id if canonical else None
     )
 
     db.add(db_file)
     db.commit()
     db.refresh(db_file)
 
-    # RAG: Index the file immediately
-    try:
-        # 1. Extract Text
-        full_text = extractor.extract_text(file_path)
-
-        if full_text:
-            # 2. Chunk Text
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len,
-                is_separator_regex=False,
-            )
-            chunks = text_splitter.split_text(full_text)
-
-            # 3. Prepare Documents for Vector Store
-            documents = []
-            for chunk in chunks:
-                documents.append({
-                    "text": chunk,
-                    "metadata": {
-                        "file_id": valid_id,
-                        "filename": file.filename
-                    }
-                })
-
-            # 4. Index
-            vector_store.add_documents(documents)
-            print(f"Indexed {len(documents)} chunks for file {file.filename}")
+    if canonical:
+        # Loaded after the commit above, so this is the job's current status
+        job = canonical.ingestion_job
+        if job and job.status == "failed":
+            # The canonical failed after it was picked; its worker may already have
+            # re-queued the duplicates it knew about, which didn't include this one
+            ingestion_queue.promote_duplicate(db, canonical.id)
+            db.refresh(db_file)
+            status = "queued"
+        else:
+            status = job.status if job else "indexed"
+    else:
+        # RAG: Queue the file for indexing. Workers pick it up in the background;
+        # clients poll GET /api/files/{id}/status for progress.
+        status = ingestion_queue.enqueue(db, db_file.id).status
 
-    except Exception as e:
-        print(f"Indexing failed for {file.filename}: {e}")
-        # We don't fail the upload, just log the error
-        # In a real app, maybe update a status flag on the file
+    return {
+        "id": db_file.id,
+        "filename": db_file.filename,
+        "url": f"/uploads/{safe_filename}",
+        "status": status,
+        "duplicate_of": db_file.duplicate_of
+    }
+
+
+@router.get("/files/{file_id}/status")
+def get_file_status(file_id: str, db: Session = Depends(get_db)):
+    db_file = db.query(FileModel).filter(FileModel.id == file_id).first()
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # Duplicates share the ingestion job of the file they were deduplicated against
+    indexed_file_id = db_file.duplicate_of or db_file.id
+    job = db.query(IngestionJob).filter(IngestionJob.file_id == indexed_file_id).first()
+    if not job:
+        if not db_file.duplicate_of:
+            raise HTTPException(status_code=404, detail="No ingestion job for file")
+        # The canonical upload was deleted along with its chat. Its blob and chunks are
+        # kept, so this duplicate is still indexed; only the job's progress is gone.
+        return {
+            "id": db_file.id,
+            "filename": db_file.filename,
+            "duplicate_of": db_file.duplicate_of,
+            "status": "indexed",
+            "error": None
+        }
 
     return {
         "id": db_file.id,
         "filename": db_file.filename,
-        "url": f"/uploads/{safe_filename}"
+        "duplicate_of": db_file.duplicate_of,
+        "status": job.status,
+        "error": job.error,
+        "page_count": job.page_count,
+        "pages_processed": job.pages_processed,
+        "chunk_count": job.chunk_count,
+        "embedding_cache": {
+            "hits": job.embedding_cache_hits,
+            "misses": job.embedding_cache_misses
+        },
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "timings": {
+            "extract_seconds": job.extract_seconds,
+            "embed_seconds": job.embed_seconds
+        }
     }
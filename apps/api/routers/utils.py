@@ -1,49 +1,103 @@
 import json
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from database import Message as MessageModel
-
-def get_latest_valid_extraction(db: Session, chat_id: str):
-    """
-    Retrieves the latest valid extracted JSON data from the assistant's message history.
-    Iterates backwards through messages to find the most recent successful extraction.
-    """
-    # Get all assistant messages ordered by time (descending)
-    messages = db.query(MessageModel).filter(
-        MessageModel.chat_id == chat_id,
-        MessageModel.role == "assistant"
-    ).order_by(desc(MessageModel.created_at)).all()
-    
-    for msg in messages:
-        content = msg.content
-        if not content:
-            continue
-        
-        # Check if content looks like JSON or Markdown JSON
-        try:
-            json_str = ""
-            if "```json" in content:
-                # Extract JSON block
-                start = content.find("```json") + 7
-                end = content.find("```", start)
-                if end == -1:
-                    # Maybe it ends at the end of string
-                    json_str = content[start:].strip()
-                else:
-                    json_str = content[start:end].strip()
-            elif content.strip().startswith("{") and content.strip().endswith("}"):
-                json_str = content.strip()
-            
-            if json_str:
-                data = json.loads(json_str)
-                # Basic validation: check for key extraction fields like 'customer' or 'banking'
-                # or just verify it's a dict
-                if isinstance(data, dict):
-                    # We assume if it parses as JSON object it might be our extraction.
-                    # Ideally strict check, but for now this suffices.
-                    return data
-        except Exception:
-            # Not valid valid JSON, continue to next message
-            continue
-    
+import re
+import uuid
+from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from database import Chat as ChatModel, File as FileModel, Extraction as ExtractionModel
+
+# Pseudo-tags the web client prepends to a message for each uploaded file
+FILE_TAG_PATTERN = re.compile(r"\[FILE_ID: ([\w-]+) FILENAME:")
+
+
+async def attach_referenced_files(db: AsyncSession, chat_id: str, content: str) -> List[str]:
+    """
+    Links files referenced by [FILE_ID: ...] tags in a message to the chat,
+    for uploads that happened before the chat existed. Returns the newly linked file ids.
+    """
+    file_ids = FILE_TAG_PATTERN.findall(content or "")
+    if not file_ids:
+        return []
+
+    files = (await db.scalars(select(FileModel).where(
+        FileModel.id.in_(file_ids),
+        FileModel.chat_id.is_(None)
+    ))).all()
+    for f in files:
+        f.chat_id = chat_id
+    await db.commit()
+    return [f.duplicate_of or f.id for f in files]
+
+
+async def get_chat_file_ids(db: AsyncSession, chat_id: str) -> List[str]:
+    """
+    Ids of the indexed files attached to a chat. Deduplicated uploads resolve to the
+    file whose chunks they share.
+    """
+    files = (await db.execute(
+        select(FileModel.id, FileModel.duplicate_of).where(FileModel.chat_id == chat_id)
+    )).all()
+    return list({f.duplicate_of or f.id for f in files})
+
+def parse_json_block(content: str):
+    """
+    Returns the JSON object from a ```json fenced block (or a bare JSON message), or None.
+    """
+    if not content:
+        return None
+    try:
+        json_str = ""
+        if "```json" in content:
+            # Extract JSON block
+            start = content.find("```json") + 7
+            end = content.find("```", start)
+            if end == -1:
+                # Maybe it ends at the end of string
+                json_str = content[start:].strip()
+            else:
+                json_str = content[start:end].strip()
+        elif content.strip().startswith("{") and content.strip().endswith("}"):
+            json_str = content.strip()
+
+        if json_str:
+            data = json.loads(json_str)
+            if isinstance(data, dict):
+                return data
+    except Exception:
+        # Not valid JSON
+        pass
     return None
+
+
+async def get_latest_valid_extraction(db: AsyncSession, chat_id: str):
+    """
+    Current extraction for a chat: the highest version in `extractions`
+    (one lookup on the (chat_id, version) index).
+    """
+    return await db.scalar(
+        select(ExtractionModel.data)
+        .where(ExtractionModel.chat_id == chat_id)
+        .order_by(ExtractionModel.version.desc())
+        .limit(1)
+    )
+
+
+async def save_extraction(db: AsyncSession, chat_id: str, message_id: str, industry: str, data: dict) -> int:
+    """
+    Stores a validated extraction as the chat's next version. The caller commits.
+    """
+    # Lock the chat row until commit so two turns finishing together can't pick the same version
+    await db.execute(select(ChatModel.id).where(ChatModel.id == chat_id).with_for_update())
+    current = await db.scalar(
+        select(func.max(ExtractionModel.version)).where(ExtractionModel.chat_id == chat_id)
+    )
+    version = (current or 0) + 1
+    db.add(ExtractionModel(
+        id=str(uuid.uuid4()),
+        chat_id=chat_id,
+        message_id=message_id,
+        version=version,
+        industry=industry,
+        data=data
+    ))
+    return version
@@ -0,0 +1,59 @@
+import sys
+import os
+import uuid
+
+# Add parent dir to path to import app modules
+# apps/api/scripts -> apps/api
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from pydantic import ValidationError
+from sqlalchemy import desc, select, exists
+from database import init_db, SessionLocal, Chat, Message, Extraction
+from routers.utils import parse_json_block
+from schemas.banking import BankingExtraction
+
+
+def backfill():
+    """
+    One-off migration for chats that predate the extractions table: find the newest
+    assistant message carrying a schema-valid extraction and store it as version 1.
+    """
+    init_db()
+    db = SessionLocal()
+    try:
+        chat_ids = db.scalars(
+            select(Chat.id).where(~exists().where(Extraction.chat_id == Chat.id))
+        ).all()
+        migrated = 0
+        for chat_id in chat_ids:
+            messages = db.scalars(select(Message).where(
+                Message.chat_id == chat_id,
+                Message.role == "assistant"
+            ).order_by(desc(Message.created_at))).all()
+
+            for msg in messages:
+                data = parse_json_block(msg.content)
+                if data is None:
+                    continue
+                try:
+                    validated = BankingExtraction.model_validate(data).model_dump(mode="json")
+                except ValidationError:
+                    continue
+                db.add(Extraction(
+                    id=str(uuid.uuid4()),
+                    chat_id=chat_id,
+                    message_id=msg.id,
+                    version=1,
+                    industry="banking",
+                    data=validated
+                ))
+                migrated += 1
+                break
+        db.commit()
+        print(f"Backfilled extractions for {migrated} of {len(chat_ids)} chats without one.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    backfill()
@@ -0,0 +1,113 @@
+import sys
+import os
+import time
+import asyncio
+import argparse
+from dataclasses import dataclass
+from typing import Any, Dict
+
+# Add parent dir to path to import app modules
+# apps/api/scripts -> apps/api
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# The registry module builds its singleton from services.agent on import; keep that offline
+os.environ.setdefault("LLM_MODEL", "test")
+
+from pydantic_ai import Agent
+from pydantic_ai.models.test import TestModel
+from schemas.banking import BankingExtraction
+from tools.query_data import get_banking_field, BankingData
+from tools.google_drive import export_to_drive, DriveDeps
+from services.agent_registry import (
+    AgentRegistry,
+    build_deps,
+    QUERY_SYSTEM_PROMPT,
+    QUERY_EXPORT_SYSTEM_PROMPT,
+    EXPORT_SYSTEM_PROMPT,
+    EXTRACTION_SYSTEM_PROMPT,
+    QUERY,
+    EXTRACTION,
+    EXPORT,
+)
+
+PROMPT = "What is the borrower name?"
+SAMPLE_DATA = {"borrower_name": "Jane Doe", "loan_amount": 250000}
+
+# (label, mode, industry, tools) for each configuration chat_endpoint can pick
+CONFIGS = [
+    ("query", QUERY, "banking", frozenset({"get_banking_field"})),
+    ("query+export", QUERY, "banking", frozenset({"get_banking_field", "export_to_drive"})),
+    ("extraction", EXTRACTION, "banking", frozenset()),
+    ("export", EXPORT, None, frozenset({"export_to_drive"})),
+]
+
+
+def build_per_request(model, mode, tools):
+    """
+    What chat_endpoint used to do on every request (including the deps dataclass
+    that was defined inline for query + export).
+    """
+    if mode == QUERY and "export_to_drive" in tools:
+        @dataclass
+        class CombinedDeps:
+            data: Dict[str, Any]
+            access_token: str
+        agent = Agent(model, system_prompt=QUERY_EXPORT_SYSTEM_PROMPT, tools=[get_banking_field, export_to_drive], deps_type=CombinedDeps)
+        return agent, CombinedDeps(data=SAMPLE_DATA, access_token="token"), None
+    if mode == QUERY:
+        agent = Agent(model, system_prompt=QUERY_SYSTEM_PROMPT, tools=[get_banking_field], deps_type=BankingData)
+        return agent, BankingData(data=SAMPLE_DATA), None
+    if mode == EXTRACTION:
+        # The output schema was passed on each run() call
+        return Agent(model, system_prompt=EXTRACTION_SYSTEM_PROMPT), None, BankingExtraction
+    agent = Agent(model, system_prompt=EXPORT_SYSTEM_PROMPT, tools=[export_to_drive], deps_type=DriveDeps)
+    return agent, DriveDeps(access_token="token"), None
+
+
+def build_from_registry(registry, mode, industry, tools):
+    agent = registry.get(mode, industry, tools)
+    return agent, build_deps(mode, tools, SAMPLE_DATA, "token"), None
+
+
+def time_setup(setup, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        setup()
+    return (time.perf_counter() - start) / requests
+
+
+async def time_request(setup, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        agent, deps, output_type = setup()
+        kwargs = {"output_type": output_type} if output_type else {}
+        await agent.run(PROMPT, deps=deps, **kwargs)
+    return (time.perf_counter() - start) / requests
+
+
+def benchmark(requests: int):
+    # call_tools=[]: measure agent overhead only, never hit Drive
+    model = TestModel(call_tools=[])
+    registry = AgentRegistry(model)
+
+    print(f"{'config':>14} {'phase':>8} {'before (us)':>12} {'after (us)':>11} {'speedup':>8}")
+    for label, mode, industry, tools in CONFIGS:
+        before = lambda: build_per_request(model, mode, tools)
+        after = lambda: build_from_registry(registry, mode, industry, tools)
+        # Warm the registry so "after" reflects the steady state
+        after()
+
+        setup_before = time_setup(before, requests)
+        setup_after = time_setup(after, requests)
+        print(f"{label:>14} {'setup':>8} {setup_before * 1e6:>12.1f} {setup_after * 1e6:>11.1f} {setup_before / setup_after:>7.1f}x")
+
+        run_before = asyncio.run(time_request(before, requests))
+        run_after = asyncio.run(time_request(after, requests))
+        print(f"{label:>14} {'+ run':>8} {run_before * 1e6:>12.1f} {run_after * 1e6:>11.1f} {run_before / run_after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-request agent setup cost: building agents per request vs AgentRegistry.")
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    benchmark(args.requests)
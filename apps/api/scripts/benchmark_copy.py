@@ -0,0 +1,78 @@
+import sys
+import os
+import random
+import time
+import argparse
+
+# Add parent dir to path to import app modules
+# apps/api/scripts -> apps/api
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database import SessionLocal, DocumentChunk, init_db
+from sqlalchemy import delete
+from services.bulk_copy import copy_document_chunks
+
+BENCHMARK_SOURCE = "benchmark_copy"
+
+
+def make_batch(size: int, dimension: int = 384):
+    documents = []
+    embeddings = []
+    for i in range(size):
+        documents.append({
+            "text": f"Synthetic benchmark chunk {i}. " * 30,
+            "metadata": {"source": BENCHMARK_SOURCE, "filename": "benchmark.pdf", "page": i // 4 + 1}
+        })
+        embeddings.append([random.uniform(-1, 1) for _ in range(dimension)])
+    return documents, embeddings
+
+
+def insert_orm(db, documents, embeddings):
+    db.add_all([
+        DocumentChunk(text=doc["text"], metadata_=doc["metadata"], embedding=embedding)
+        for doc, embedding in zip(documents, embeddings)
+    ])
+
+
+def insert_copy(db, documents, embeddings):
+    copy_document_chunks(db, documents, embeddings)
+
+
+def cleanup():
+    db = SessionLocal()
+    try:
+        db.execute(delete(DocumentChunk).where(DocumentChunk.metadata_["source"].as_string() == BENCHMARK_SOURCE))
+        db.commit()
+    finally:
+        db.close()
+
+
+def run(method, documents, embeddings) -> float:
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        method(db, documents, embeddings)
+        db.commit()
+        return time.perf_counter() - start
+    finally:
+        db.close()
+        cleanup()
+
+
+def benchmark(sizes, repeats):
+    init_db()
+    cleanup()
+    print(f"{'rows':>8} {'orm (s)':>10} {'copy (s)':>10} {'speedup':>8}")
+    for size in sizes:
+        documents, embeddings = make_batch(size)
+        orm_time = min(run(insert_orm, documents, embeddings) for _ in range(repeats))
+        copy_time = min(run(insert_copy, documents, embeddings) for _ in range(repeats))
+        print(f"{size:>8} {orm_time:>10.3f} {copy_time:>10.3f} {orm_time / copy_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare ORM add_all with binary COPY for document_chunks inserts.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[32, 256, 2048, 16384])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    benchmark(args.sizes, args.repeats)
@@ -0,0 +1,30 @@
+import sys
+import os
+import time
+
+# Add parent dir to path to import app modules
+# apps/api/scripts -> apps/api
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Standalone ingestion worker: python scripts/ingestion_worker.py
+# Extraction workers are spawned, and a spawned child re-imports the parent's main
+# module (as __mp_main__). Nothing heavy may load at import time here, or every
+# extraction worker would open its own DB engines, embedding model and vector store.
+
+
+def main():
+    from database import init_db
+    from services.ingestion import ingestion_queue
+
+    init_db()
+    ingestion_queue.num_workers = max(ingestion_queue.num_workers, 1)
+    ingestion_queue.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        ingestion_queue.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import sys
+import os
+import argparse
+
+# Add parent dir to path to import app modules
+# apps/api/scripts -> apps/api
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database import init_db
+from services.vector_index import (
+    VECTOR_INDEX_TYPE,
+    VECTOR_METRIC,
+    VECTOR_QUANTIZATION,
+    METRICS,
+    build_index,
+    drop_index,
+    index_status,
+    build_progress,
+)
+
+
+def status():
+    indexes = index_status()
+    if not indexes:
+        print("No vector index on document_chunks.embedding (searches use a sequential scan).")
+    for idx in indexes:
+        validity = "valid" if idx["valid"] else "INVALID (interrupted build?)"
+        print(f"{idx['name']}: {idx['size']}, {validity}")
+        print(f"  {idx['definition']}")
+
+    for build in build_progress():
+        blocks = f"{build['blocks_done']}/{build['blocks_total']} blocks" if build["blocks_total"] else ""
+        tuples = f"{build['tuples_done']}/{build['tuples_total']} tuples" if build["tuples_total"] else ""
+        print(f"Building {build['index_name'] or '(pending)'} [pid {build['pid']}]: {build['phase']} {blocks} {tuples}".rstrip())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the pgvector index on document_chunks.embedding.")
+    parser.add_argument("command", choices=["build", "drop", "status"])
+    parser.add_argument("--type", choices=["hnsw", "ivfflat"], default=VECTOR_INDEX_TYPE if VECTOR_INDEX_TYPE != "none" else "hnsw")
+    parser.add_argument("--metric", choices=list(METRICS), default=VECTOR_METRIC)
+    parser.add_argument("--quantization", choices=["none", "halfvec", "binary"], default=VECTOR_QUANTIZATION)
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "build":
+        build_index(args.type, args.metric, args.quantization)
+    elif args.command == "drop":
+        drop_index(args.type, args.metric, args.quantization)
+    status()
@@ -0,0 +1,25 @@
+import sys
+import os
+import argparse
+
+# Add parent dir to path to import app modules
+# apps/api/scripts -> apps/api
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.vector_store import vector_store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot or restore the local (VECTOR_BACKEND=local) vector index.")
+    parser.add_argument("command", choices=["snapshot", "restore"])
+    parser.add_argument("path", help="Snapshot directory")
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        # Safe while the API is running: chunks.db is copied with SQLite's online backup
+        print(f"Snapshot written to {vector_store.snapshot(args.path)}")
+    else:
+        # Stop the API first; a running server keeps its own in-memory graph
+        vector_store.restore(args.path)
+        print(f"Restored vector index from {args.path}")
+    vector_store.close()
@@ -0,0 +1,179 @@
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, Optional, Tuple
+from pydantic_ai import Agent
+from prompts.industries import INDUSTRY_PROMPTS
+from schemas.banking import BankingExtraction
+from tools.query_data import get_banking_field, BankingData
+from tools.google_drive import export_to_drive, DriveDeps
+
+QUERY_SYSTEM_PROMPT = (
+    "You are a helpful banking assistant with access to previously extracted data. "
+    "You generally have two modes:\n"
+    "1. FIELD QUERY: If the user asks for a specific value (e.g. 'What is the borrower name?', 'How much is the loan?'), "
+    "you MUST use the `get_banking_field` tool to get the exact value. Do not guess.\n"
+    "2. ANALYSIS/SUMMARY: If the user asks for a summary, analysis, or general question, "
+    "you should answer based on the full context you have. You do not need to call the tool for every field if summarizing everything, "
+    "but you should use the tool if you need to be precise about specific numbers.\n\n"
+    "If the user asks to UPDATE or RE-EXTRACT data, you should refuse and say you are in query mode, "
+    "or (if implemented) trigger a re-extraction flow (not active yet)."
+)
+
+QUERY_EXPORT_SYSTEM_PROMPT = (
+    "You are a helpful banking assistant with access to previously extracted data. "
+    "You generally have two modes:\n"
+    "1. FIELD QUERY: If the user asks for a specific value (e.g. 'What is the borrower name?', 'How much is the loan?'), "
+    "you MUST use the `get_banking_field` tool to get the exact value. Do not guess.\n"
+    "2. ANALYSIS/SUMMARY: If the user asks for a summary, analysis, or general question, "
+    "you should answer based on the full context you have.\n"
+    "3. EXPORT: If the user asks to export data to Google Drive, use the `export_to_drive` tool.\n"
+)
+
+# We use a minimal system prompt that forces tool usage and relies on the Pydantic model for schema definition.
+# We avoid feeding the text-based schema from INDUSTRY_PROMPTS as it confuses the model.
+EXTRACTION_SYSTEM_PROMPT = (
+    "You are a strict data extraction engine. You are forbidden from speaking.\n"
+    "You must ONLY call the `BankingExtraction` tool with data from the document.\n"
+    "If you cannot extract data, call the tool with null values.\n"
+    "Outputting text or markdown is a system violation."
+)
+
+EXPORT_SYSTEM_PROMPT = (
+    "You are a helpful assistant. "
+    "If the user asks to export a file or content to Google Drive, use the `export_to_drive` tool."
+)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and a document analysis assistant. "
+    "Given the current summary and the next turns, return the updated summary. "
+    "Keep names, figures, dates, extracted field values, decisions and open questions; drop pleasantries. "
+    "Return only the summary text."
+)
+
+# Agent modes
+DEFAULT = "default"
+INDUSTRY = "industry"
+QUERY = "query"
+EXTRACTION = "extraction"
+EXPORT = "export"
+SUMMARY = "summary"
+
+TOOLS = {
+    "get_banking_field": get_banking_field,
+    "export_to_drive": export_to_drive,
+}
+
+AgentKey = Tuple[str, Optional[str], FrozenSet[str]]
+
+
+@dataclass
+class CombinedDeps:
+    """
+    Deps for the query + export agent: extracted data for `get_banking_field`,
+    a Drive token for `export_to_drive`.
+    """
+    data: Dict[str, Any]
+    access_token: str
+
+
+def select_agent(
+    industry: Optional[str],
+    extracted_data: Optional[Dict[str, Any]],
+    drive_token: Optional[str]
+) -> Tuple[str, FrozenSet[str]]:
+    """
+    Chooses the agent configuration for a chat turn: (mode, tool names).
+    """
+    mode, tools = DEFAULT, frozenset()
+    if industry and INDUSTRY_PROMPTS.get(industry):
+        if industry == "banking":
+            # Query mode once data has been extracted, schema-enforced extraction before that
+            mode, tools = (QUERY, frozenset({"get_banking_field"})) if extracted_data else (EXTRACTION, frozenset())
+        else:
+            # Prompt-only Mode (for now, until other schemas are defined)
+            mode = INDUSTRY
+
+    # Drive export is offered whenever we aren't in strict extraction mode
+    if drive_token and mode != EXTRACTION:
+        if industry == "banking" and extracted_data:
+            mode, tools = QUERY, frozenset({"get_banking_field", "export_to_drive"})
+        elif not industry:
+            mode, tools = EXPORT, frozenset({"export_to_drive"})
+    return mode, tools
+
+
+def build_deps(
+    mode: str,
+    tools: FrozenSet[str],
+    extracted_data: Optional[Dict[str, Any]],
+    drive_token: Optional[str]
+):
+    """
+    Per-request deps for an agent returned by AgentRegistry.get().
+    """
+    if mode == QUERY:
+        if "export_to_drive" in tools:
+            return CombinedDeps(data=extracted_data, access_token=drive_token)
+        return BankingData(data=extracted_data)
+    if mode == EXPORT:
+        return DriveDeps(access_token=drive_token)
+    return None
+
+
+class AgentRegistry:
+    """
+    Builds each (mode, industry, toolset) agent once and hands the same instance to
+    every request. Agents hold no per-request state; deps are passed to run()/run_stream().
+    """
+
+    def __init__(self, model, default_agent: Optional[Agent] = None):
+        self.model = model
+        self.default_agent = default_agent
+        self._agents: Dict[AgentKey, Agent] = {}
+        self._lock = threading.Lock()
+
+    def get(self, mode: str, industry: Optional[str] = None, tools: Iterable[str] = ()) -> Agent:
+        key = (mode, industry, frozenset(tools))
+        agent = self._agents.get(key)
+        if agent is None:
+            with self._lock:
+                agent = self._agents.get(key)
+                if agent is None:
+                    agent = self._build(*key)
+                    self._agents[key] = agent
+                    print(f"Built {mode} agent (industry={industry}, tools={sorted(key[2])})")
+        return agent
+
+    def _build(self, mode: str, industry: Optional[str], tools: FrozenSet[str]) -> Agent:
+        # With only LLM_MODEL set there is no model object, but the default agent still has
+        # one; mode agents must be built on it (the extraction agent needs its output type)
+        model = self.model or (self.default_agent.model if self.default_agent else None)
+        if mode == DEFAULT or model is None:
+            if self.default_agent is None:
+                raise ValueError("No default agent configured")
+            return self.default_agent
+
+        tool_fns = [TOOLS[name] for name in sorted(tools)]
+        if mode == QUERY:
+            if "export_to_drive" in tools:
+                return Agent(model, system_prompt=QUERY_EXPORT_SYSTEM_PROMPT, tools=tool_fns, deps_type=CombinedDeps)
+            return Agent(model, system_prompt=QUERY_SYSTEM_PROMPT, tools=tool_fns, deps_type=BankingData)
+        if mode == EXTRACTION:
+            # Output schema is prepared once here rather than per run()
+            return Agent(model, system_prompt=EXTRACTION_SYSTEM_PROMPT, output_type=BankingExtraction)
+        if mode == EXPORT:
+            return Agent(model, system_prompt=EXPORT_SYSTEM_PROMPT, tools=tool_fns, deps_type=DriveDeps)
+        if mode == SUMMARY:
+            return Agent(model, system_prompt=SUMMARY_SYSTEM_PROMPT)
+        if mode == INDUSTRY:
+            return Agent(model, system_prompt=INDUSTRY_PROMPTS[industry])
+        raise ValueError(f"Unknown agent mode: {mode}")
+
+
+def _create_registry() -> AgentRegistry:
+    from services.agent import agent, model
+    return AgentRegistry(model, default_agent=agent)
+
+
+# Singleton
+agent_registry = _create_registry()
@@ -0,0 +1,87 @@
+import io
+import json
+import struct
+from typing import Dict, Iterable, Iterator, List, Sequence
+from sqlalchemy.orm import Session
+
+# Binary COPY framing: https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+COPY_TRAILER = struct.pack("!h", -1)
+NULL_FIELD = struct.pack("!i", -1)
+
+
+def encode_field(value: bytes) -> bytes:
+    return struct.pack("!i", len(value)) + value
+
+
+def encode_text(value) -> bytes:
+    if value is None:
+        return NULL_FIELD
+    return encode_field(value.encode("utf-8"))
+
+
+def encode_json(value) -> bytes:
+    # The binary representation of `json` is the same as its text representation
+    return encode_text(json.dumps(value))
+
+
+def encode_vector(values: Sequence[float]) -> bytes:
+    # pgvector's vector_send: int16 dimensions, int16 unused, float4[dimensions]
+    dim = len(values)
+    return encode_field(struct.pack(f"!hh{dim}f", dim, 0, *values))
+
+
+class IterStream(io.RawIOBase):
+    """
+    File-like wrapper over an iterator of byte strings, so copy_expert
+    can stream rows without materializing the whole payload.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def iter_chunk_rows(documents: List[Dict], embeddings: List[Sequence[float]]) -> Iterator[bytes]:
+    yield COPY_HEADER
+    for doc, embedding in zip(documents, embeddings):
+        metadata = doc.get("metadata", {})
+        yield (
+            struct.pack("!h", 5)
+            + encode_text(doc["text"])
+            + encode_json(metadata)
+            + encode_vector(embedding)
+            + encode_text(metadata.get("file_id"))
+            + encode_text(metadata.get("chat_id"))
+        )
+    yield COPY_TRAILER
+
+
+def copy_document_chunks(db: Session, documents: List[Dict], embeddings: List[Sequence[float]]) -> int:
+    """
+    Bulk-load chunks into document_chunks with COPY ... (FORMAT binary), inside the
+    session's current transaction. The caller commits.
+    """
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY document_chunks (text, metadata, embedding, file_id, chat_id) FROM STDIN WITH (FORMAT binary)",
+            IterStream(iter_chunk_rows(documents, embeddings))
+        )
+        return len(documents)
+    finally:
+        cursor.close()
@@ -0,0 +1,135 @@
+import os
+import threading
+from typing import List, Optional, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelRequest,
+    ModelResponse,
+    SystemPromptPart,
+    TextPart,
+    UserPromptPart
+)
+from database import Chat as ChatModel, Message as MessageModel
+
+# Prior turns sent to the model are trimmed (oldest first) to fit this many tokens
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "4000"))
+# Most rows read per request, so a very long chat never loads in full
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "100"))
+# tiktoken encoding used to estimate sizes; providers tokenize differently, so counts are approximate
+HISTORY_ENCODING = os.getenv("HISTORY_ENCODING", "cl100k_base")
+# Role / framing tokens each message costs on top of its content
+MESSAGE_TOKEN_OVERHEAD = 4
+
+# (role, content, token_count) oldest first
+HistoryRow = Tuple[str, str, int]
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_failed = False
+
+
+def _get_encoding():
+    # Loaded on first use; tiktoken downloads the BPE file the first time if it isn't cached
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(HISTORY_ENCODING)
+                except Exception as e:
+                    print(f"tiktoken unavailable ({e}); estimating history tokens from length")
+                    _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text: Optional[str]) -> int:
+    if not text:
+        return MESSAGE_TOKEN_OVERHEAD
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + MESSAGE_TOKEN_OVERHEAD
+    return len(encoding.encode(text, disallowed_special=())) + MESSAGE_TOKEN_OVERHEAD
+
+
+def token_meta(text: Optional[str]) -> dict:
+    """
+    Message.meta for a new row, so later requests don't re-tokenize it.
+    """
+    return {"token_count": count_tokens(text)}
+
+
+def row_tokens(content: Optional[str], meta: Optional[dict]) -> int:
+    # Rows written before token counts were stored are counted here
+    tokens = (meta or {}).get("token_count")
+    return tokens if tokens is not None else count_tokens(content)
+
+
+def window(rows: Sequence[HistoryRow], budget: int = HISTORY_TOKEN_BUDGET) -> List[HistoryRow]:
+    """
+    The most recent rows whose token counts fit in `budget`, oldest first.
+    The window always starts on a user turn.
+    """
+    kept: List[HistoryRow] = []
+    used = 0
+    for row in reversed(rows):
+        if used + row[2] > budget:
+            break
+        kept.append(row)
+        used += row[2]
+    kept.reverse()
+
+    # Don't open the conversation with an orphaned assistant reply
+    while kept and kept[0][0] != "user":
+        kept.pop(0)
+    return kept
+
+
+def to_model_messages(rows: Sequence[HistoryRow]) -> List[ModelMessage]:
+    messages: List[ModelMessage] = []
+    for role, content, _ in rows:
+        if not content:
+            continue
+        if role == "user":
+            messages.append(ModelRequest(parts=[UserPromptPart(content=content)]))
+        elif role == "assistant":
+            messages.append(ModelResponse(parts=[TextPart(content=content)]))
+    return messages
+
+
+def summary_message(summary: str) -> ModelMessage:
+    return ModelRequest(parts=[SystemPromptPart(
+        content=f"Summary of the earlier part of this conversation:\n{summary}"
+    )])
+
+
+async def load_history(
+    db: AsyncSession,
+    chat: ChatModel,
+    budget: int = HISTORY_TOKEN_BUDGET
+) -> List[ModelMessage]:
+    """
+    Stored turns of a chat as pydantic_ai history, trimmed to the token budget.
+    Turns already folded into the chat's running summary are replaced by the summary.
+    Reads at most HISTORY_MAX_MESSAGES rows, newest first, via (chat_id, created_at).
+    """
+    stmt = select(MessageModel.role, MessageModel.content, MessageModel.meta).where(MessageModel.chat_id == chat.id)
+    if chat.summary_through is not None:
+        stmt = stmt.where(MessageModel.created_at > chat.summary_through)
+    result = await db.execute(stmt.order_by(MessageModel.created_at.desc()).limit(HISTORY_MAX_MESSAGES))
+
+    rows = []
+    for role, content, meta in reversed(result.all()):
+        rows.append((role, content, row_tokens(content, meta)))
+
+    summary_tokens = (chat.summary_tokens or 0) if chat.summary else 0
+    kept = window(rows, max(budget - summary_tokens, 0))
+    if len(kept) < len(rows):
+        print(f"History: kept {len(kept)}/{len(rows)} messages ({sum(r[2] for r in kept)} tokens, budget {budget})")
+
+    messages = to_model_messages(kept)
+    if chat.summary:
+        messages.insert(0, summary_message(chat.summary))
+    return messages
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, NamedTuple, Optional, Tuple, Union
+
+# SSE payloads for /api/chat:
+#   'snapshot' - every content event carries the delta and the full text so far (original protocol)
+#   'delta'    - content events carry only the delta; a final 'message' event carries the full text
+CHAT_STREAM_MODE = os.getenv("CHAT_STREAM_MODE", "snapshot")
+# Text deltas are coalesced for this many seconds before an event is sent; 0 sends every delta
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.05"))
+
+# Events kept per stream for clients that reconnect with Last-Event-ID
+STREAM_REPLAY_EVENTS = int(os.getenv("STREAM_REPLAY_EVENTS", "1000"))
+# How long a finished stream stays attachable before only the persisted message is left
+STREAM_RETENTION = float(os.getenv("STREAM_RETENTION", "300"))
+# A generation nobody has followed for this many seconds is cancelled; negative never cancels
+STREAM_DISCONNECT_GRACE = float(os.getenv("STREAM_DISCONNECT_GRACE", "10"))
+
+STREAM_MODES = ("snapshot", "delta")
+
+
+def sse_data(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def status_event(status: str) -> str:
+    """
+    Sent before the closing event when a reply did not complete (e.g. 'cancelled').
+    """
+    return sse_data({"type": "status", "status": status})
+
+
+END_EVENT = "event: end\ndata: \n\n"
+
+
+class TextDelta(NamedTuple):
+    """
+    A content event before rendering: the delta and the length of the response text
+    after it. Snapshot-mode events are rendered from this when sent, so buffers hold
+    each piece of text once instead of a growing copy per event.
+    """
+    delta: str
+    end: int
+
+
+# What a generator hands to ChatStream: a content delta or an already rendered SSE event
+StreamEvent = Union[TextDelta, str]
+
+
+class ContentEncoder:
+    """
+    Turns the text deltas of one assistant response into SSE events and keeps the
+    accumulated text, so nothing has to diff cumulative snapshots.
+    """
+
+    def __init__(self, mode: Optional[str] = None):
+        self.mode = mode or CHAT_STREAM_MODE
+        if self.mode not in STREAM_MODES:
+            raise ValueError(f"Unknown stream mode: {self.mode}")
+        self.text = ""
+
+    def delta(self, delta: str) -> TextDelta:
+        self.text += delta
+        return TextDelta(delta, len(self.text))
+
+    def render(self, event: StreamEvent) -> str:
+        if not isinstance(event, TextDelta):
+            return event
+        if self.mode == "delta":
+            return sse_data({"type": "content", "delta": event.delta})
+        return sse_data({"type": "content", "delta": event.delta, "content": self.text[:event.end]})
+
+    def final(self) -> Optional[str]:
+        """
+        Closing event with the complete message (delta mode only).
+        """
+        if self.mode == "delta":
+            return sse_data({"type": "message", "content": self.text})
+        return None
+
+    def resync(self, length: int) -> str:
+        """
+        The first `length` characters of the text, for a client whose missed events
+        are no longer in the replay buffer.
+        """
+        text = self.text[:length]
+        if self.mode == "delta":
+            return sse_data({"type": "snapshot", "content": text})
+        return sse_data({"type": "content", "delta": "", "content": text})
+
+    def error(self, message: str) -> str:
+        if self.mode == "delta":
+            return sse_data({"type": "error", "error": message})
+        return sse_data({"type": "content", "delta": message, "content": message})
+
+
+class ChatStream:
+    """
+    One assistant response being generated. The generation runs as its own task and
+    publishes numbered SSE events here; HTTP responses only follow the buffer, so a
+    dropped connection doesn't lose the answer. If nobody re-attaches within the
+    disconnect grace period, the generation task is cancelled.
+    """
+
+    def __init__(
+        self,
+        stream_id: str,
+        chat_id: str,
+        encoder: ContentEncoder,
+        replay_events: int = STREAM_REPLAY_EVENTS,
+        disconnect_grace: float = STREAM_DISCONNECT_GRACE
+    ):
+        self.stream_id = stream_id
+        self.chat_id = chat_id
+        self.encoder = encoder
+        # (event id, unrendered event, length of the response text before this event).
+        # Followers read the live stream from this buffer too, so it holds at least one event.
+        self.events: Deque[Tuple[int, StreamEvent, int]] = deque(maxlen=max(replay_events, 1))
+        self.last_event_id = 0
+        self._text_length = 0
+        self.done = False
+        # 'complete' or 'cancelled'
+        self.status = "complete"
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.disconnect_grace = disconnect_grace
+        self.followers = 0
+        self._cancel_timer: Optional[asyncio.TimerHandle] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, event: StreamEvent):
+        self.last_event_id += 1
+        self.events.append((self.last_event_id, event, self._text_length))
+        self._text_length = len(self.encoder.text)
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def finish(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        if self._cancel_timer is not None:
+            self._cancel_timer.cancel()
+            self._cancel_timer = None
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def follow(self, last_event_id: int = 0) -> AsyncIterator[str]:
+        """
+        Events after `last_event_id`, live until the stream finishes.
+        """
+        self._attach()
+        try:
+            async for event in self._events_after(last_event_id):
+                yield event
+        finally:
+            self._detach()
+
+    def _attach(self):
+        self.followers += 1
+        if self._cancel_timer is not None:
+            # Reconnected within the grace period
+            self._cancel_timer.cancel()
+            self._cancel_timer = None
+
+    def _detach(self):
+        self.followers -= 1
+        if self.followers or self.done or self.disconnect_grace < 0:
+            return
+        self._cancel_timer = asyncio.get_running_loop().call_later(self.disconnect_grace, self._cancel_if_abandoned)
+
+    def _cancel_if_abandoned(self):
+        self._cancel_timer = None
+        if self.followers or self.done or self.task is None:
+            return
+        print(f"Chat stream {self.stream_id}: client gone for {self.disconnect_grace}s, cancelling generation")
+        self.task.cancel()
+
+    async def _events_after(self, last_event_id: int) -> AsyncIterator[str]:
+        cursor = last_event_id
+        while True:
+            if self.events and cursor < self.events[0][0] - 1:
+                # Missed events were evicted from the buffer: resend the text up to the
+                # oldest buffered event, then replay the buffer from there
+                first_id, _, text_length = self.events[0]
+                cursor = first_id - 1
+                yield f"id: {cursor}\n{self.encoder.resync(text_length)}"
+            for event_id, event, _ in list(self.events):
+                if event_id > cursor:
+                    cursor = event_id
+                    yield f"id: {event_id}\n{self.encoder.render(event)}"
+            if self.done and cursor >= self.last_event_id:
+                return
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.done or self.last_event_id > cursor)
+
+
+class ChatStreamRegistry:
+    """
+    Live and recently finished chat streams by id, for reconnecting clients.
+    """
+
+    def __init__(self, retention: float = STREAM_RETENTION):
+        self.retention = retention
+        self._streams: Dict[str, ChatStream] = {}
+
+    def start(self, stream: ChatStream, events: AsyncIterator[StreamEvent]) -> ChatStream:
+        self._prune()
+        self._streams[stream.stream_id] = stream
+        stream.task = asyncio.create_task(self._pump(stream, events))
+        return stream
+
+    async def _pump(self, stream: ChatStream, events: AsyncIterator[StreamEvent]):
+        try:
+            async for event in events:
+                await stream.publish(event)
+        except asyncio.CancelledError:
+            stream.status = "cancelled"
+            raise
+        finally:
+            # If the cancel landed here rather than inside the generator, close it now so
+            # its cleanup (saving the partial answer) runs before the stream is marked done
+            await events.aclose()
+            if stream.status == "cancelled":
+                # A client re-attaching later must be able to tell the reply was cut short
+                await stream.publish(status_event(stream.status))
+                await stream.publish(END_EVENT)
+            await stream.finish()
+
+    def get(self, stream_id: str) -> Optional[ChatStream]:
+        self._prune()
+        return self._streams.get(stream_id)
+
+    def _prune(self):
+        now = time.monotonic()
+        expired = [
+            stream_id for stream_id, stream in self._streams.items()
+            if stream.done and now - stream.finished_at > self.retention
+        ]
+        for stream_id in expired:
+            del self._streams[stream_id]
+
+    async def aclose(self):
+        tasks = [stream.task for stream in self._streams.values() if stream.task and not stream.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._streams.clear()
+
+
+# Singleton
+chat_streams = ChatStreamRegistry()
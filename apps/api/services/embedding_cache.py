@@ -0,0 +1,90 @@
+import hashlib
+import os
+import threading
+import unicodedata
+from typing import Callable, List, Tuple
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from database import EmbeddingCacheEntry
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalization applied before hashing: Unicode NFC and collapsed whitespace,
+    so re-extracted copies of the same page map to the same key.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache in Postgres, keyed by (model name, normalized text hash).
+    Only cache misses are sent to the embedding model.
+    """
+
+    def __init__(self, model_name: str, enabled: bool = EMBEDDING_CACHE_ENABLED):
+        self.model_name = model_name
+        self.enabled = enabled
+        # Lifetime counters for this process
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def embed_documents(
+        self,
+        db: Session,
+        texts: List[str],
+        embed_fn: Callable[[List[str]], List[List[float]]]
+    ) -> Tuple[List[List[float]], int]:
+        """
+        Returns (embeddings aligned with `texts`, number of cache hits).
+        New embeddings are written through in the caller's transaction.
+        """
+        if not self.enabled:
+            return embed_fn(texts), 0
+
+        hashes = [text_hash(t) for t in texts]
+
+        stmt = select(EmbeddingCacheEntry.text_hash, EmbeddingCacheEntry.embedding).where(
+            EmbeddingCacheEntry.model_name == self.model_name,
+            EmbeddingCacheEntry.text_hash.in_(set(hashes))
+        )
+        cached = {row.text_hash: row.embedding for row in db.execute(stmt)}
+
+        # Embed each distinct missing text once, even if it repeats within the batch
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = t
+
+        if missing:
+            new_embeddings = embed_fn(list(missing.values()))
+            computed = dict(zip(missing.keys(), new_embeddings))
+            db.execute(
+                insert(EmbeddingCacheEntry)
+                .values([
+                    {"model_name": self.model_name, "text_hash": h, "embedding": e}
+                    for h, e in computed.items()
+                ])
+                .on_conflict_do_nothing()
+            )
+            cached.update(computed)
+
+        hits = len(texts) - len(missing)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(missing)
+
+        return [cached[h] for h in hashes], hits
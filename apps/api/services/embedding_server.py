@@ -0,0 +1,210 @@
+import ipaddress
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from typing import List, Optional
+
+if __name__ == "__main__":
+    # Run standalone: load .env before any settings are read, as main.py does
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from services.embeddings import EmbeddingBackend, create_embedding_backend
+
+# "host:port" or a unix socket path. When set, API workers embed through the shared server
+# instead of each loading their own copy of the model.
+EMBEDDING_SERVER_ADDRESS = os.getenv("EMBEDDING_SERVER_ADDRESS", "")
+# Shared secret for the connection handshake. multiprocessing.connection pickles its payloads,
+# so nothing may connect without it; there is deliberately no default.
+EMBEDDING_SERVER_AUTHKEY = os.getenv("EMBEDDING_SERVER_AUTHKEY", "")
+# Only loopback / unix socket addresses are used unless this is set explicitly
+EMBEDDING_SERVER_ALLOW_REMOTE = os.getenv("EMBEDDING_SERVER_ALLOW_REMOTE", "false").lower() == "true"
+# Upper bound on texts per forward pass when coalescing concurrent requests
+EMBEDDING_SERVER_MAX_BATCH = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH", "64"))
+# How long the first request of a batch waits for others to join it
+EMBEDDING_SERVER_MAX_WAIT_MS = float(os.getenv("EMBEDDING_SERVER_MAX_WAIT_MS", "5"))
+
+
+def parse_address(address: str):
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def _is_loopback(address) -> bool:
+    if isinstance(address, str):
+        # Unix socket path
+        return True
+    host = address[0]
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def connection_settings(address: str):
+    """
+    Parsed address and auth key, refusing to run without a key or, unless
+    EMBEDDING_SERVER_ALLOW_REMOTE is set, on a non-loopback address.
+    """
+    if not EMBEDDING_SERVER_AUTHKEY:
+        raise RuntimeError("EMBEDDING_SERVER_AUTHKEY must be set to use the embedding server")
+    parsed = parse_address(address)
+    if not _is_loopback(parsed) and not EMBEDDING_SERVER_ALLOW_REMOTE:
+        raise RuntimeError(
+            f"Embedding server address {address} is not loopback; "
+            "set EMBEDDING_SERVER_ALLOW_REMOTE=true to use it over the network"
+        )
+    return parsed, EMBEDDING_SERVER_AUTHKEY.encode()
+
+
+class _PendingRequest:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.result = None
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+
+class EmbeddingServer:
+    """
+    Single process that owns the embedding model. Connection threads enqueue
+    requests; one batcher thread coalesces them into micro-batches bounded by
+    `max_batch` texts and `max_wait_ms`, runs the model once, and fans results back out.
+    """
+
+    def __init__(
+        self,
+        backend: EmbeddingBackend,
+        address: str = EMBEDDING_SERVER_ADDRESS,
+        max_batch: int = EMBEDDING_SERVER_MAX_BATCH,
+        max_wait_ms: float = EMBEDDING_SERVER_MAX_WAIT_MS
+    ):
+        self.backend = backend
+        self.address, self._authkey = connection_settings(address)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._requests = queue.Queue()
+
+    def serve_forever(self):
+        threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True).start()
+        with Listener(self.address, backlog=128, authkey=self._authkey) as listener:
+            print(f"Embedding server ({self.backend.model_name}) listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"Embedding server rejected connection: {e}")
+                    continue
+                threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+
+    def _handle_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                if op == "info":
+                    conn.send(("ok", {"model_name": self.backend.model_name, "dimension": self.backend.dimension}))
+                    continue
+
+                pending = _PendingRequest(payload if op == "documents" else [payload])
+                self._requests.put(pending)
+                pending.done.wait()
+                if pending.error is not None:
+                    conn.send(("error", str(pending.error)))
+                elif op == "documents":
+                    conn.send(("ok", pending.result))
+                else:
+                    conn.send(("ok", pending.result[0]))
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._requests.get()]
+            size = len(batch[0].texts)
+            deadline = time.monotonic() + self.max_wait
+
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(pending)
+                size += len(pending.texts)
+
+            texts = [t for pending in batch for t in pending.texts]
+            try:
+                embeddings = self.backend.embed_documents(texts)
+                offset = 0
+                for pending in batch:
+                    pending.result = embeddings[offset:offset + len(pending.texts)]
+                    offset += len(pending.texts)
+            except Exception as e:
+                print(f"Embedding batch of {len(texts)} texts failed: {e}")
+                for pending in batch:
+                    pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+
+class RemoteEmbeddingBackend(EmbeddingBackend):
+    """
+    Client side of EmbeddingServer. Keeps one connection per thread;
+    the server reports the model name so the embedding cache namespace matches.
+    """
+
+    def __init__(self, address: str = EMBEDDING_SERVER_ADDRESS):
+        self.address, self._authkey = connection_settings(address)
+        self._local = threading.local()
+        info = self._call("info", None)
+        self.model_name = info["model_name"]
+        self.dimension = info["dimension"]
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.address, authkey=self._authkey)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, op: str, payload):
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.send((op, payload))
+                status, result = conn.recv()
+                break
+            except (EOFError, OSError):
+                # Server restarted: reconnect once
+                self._local.conn = None
+                if attempt:
+                    raise
+        if status != "ok":
+            raise RuntimeError(f"Embedding server error: {result}")
+        return result
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call("documents", texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call("query", text)
+
+
+if __name__ == "__main__":
+    # python -m services.embedding_server
+    if not EMBEDDING_SERVER_ADDRESS:
+        raise SystemExit("Set EMBEDDING_SERVER_ADDRESS (e.g. 127.0.0.1:7997) to run the embedding server.")
+    if not EMBEDDING_SERVER_AUTHKEY:
+        raise SystemExit("Set EMBEDDING_SERVER_AUTHKEY to a random secret shared with the API workers.")
+    EmbeddingServer(create_embedding_backend(server_address="")).serve_forever()
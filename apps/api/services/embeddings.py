@@ -0,0 +1,130 @@
+import os
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+# Which embedding implementation VectorStore uses: huggingface (PyTorch fp32) or onnx (int8 ONNX Runtime)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "huggingface")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Texts per forward pass
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Intra-op threads for the model; 0 keeps the runtime default (all cores)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+# Quantized export shipped in the sentence-transformers model repo, or a local .onnx path
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE", "onnx/model_quint8_avx2.onnx")
+# all-MiniLM-L6-v2 was trained with 256-token inputs; sentence-transformers truncates there too
+ONNX_MAX_LENGTH = int(os.getenv("ONNX_MAX_LENGTH", "256"))
+
+
+class EmbeddingBackend(ABC):
+    """
+    Interface VectorStore uses to turn text into vectors.
+    `model_name` doubles as the embedding cache namespace, so backends that
+    produce (even slightly) different vectors must use different names.
+    """
+    model_name: str
+    dimension: int = 384
+
+    @abstractmethod
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        ...
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class HuggingFaceBackend(EmbeddingBackend):
+    def __init__(self, model_name: str = EMBEDDING_MODEL, batch_size: int = EMBEDDING_BATCH_SIZE, threads: int = EMBEDDING_THREADS):
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+
+        self.model_name = model_name
+        self._model = HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._model.embed_query(text)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    int8-quantized ONNX Runtime CPU backend. Mean pooling + L2 normalization
+    reproduce the sentence-transformers pipeline, so vectors stay compatible
+    with the existing Vector(384) column.
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        model_file: str = ONNX_MODEL_FILE,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        threads: int = EMBEDDING_THREADS,
+        dimension: int = 384
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        from huggingface_hub import hf_hub_download
+
+        repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        model_path = model_file if os.path.exists(model_file) else hf_hub_download(repo_id, model_file)
+
+        self.tokenizer = Tokenizer.from_file(hf_hub_download(repo_id, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=ONNX_MAX_LENGTH)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.batch_size = batch_size
+        self.dimension = dimension
+        self.model_name = f"{model_name}:onnx:{os.path.splitext(os.path.basename(model_file))[0]}"
+
+        probe = self.embed_query("dimension check")
+        if len(probe) != dimension:
+            raise ValueError(f"ONNX model produces {len(probe)}-dim vectors, expected {dimension}")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        import numpy as np
+
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + self.batch_size])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # Mean pooling over real (non-padding) tokens, then L2 normalize
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            embeddings.extend(pooled.tolist())
+        return embeddings
+
+
+def create_embedding_backend(name: str = EMBEDDING_BACKEND, server_address: Optional[str] = None) -> EmbeddingBackend:
+    if server_address is None:
+        from services.embedding_server import EMBEDDING_SERVER_ADDRESS
+        server_address = EMBEDDING_SERVER_ADDRESS
+    if server_address:
+        # Shared model in the embedding server process (python -m services.embedding_server)
+        from services.embedding_server import RemoteEmbeddingBackend
+        return RemoteEmbeddingBackend(server_address)
+    if name == "onnx":
+        return OnnxBackend()
+    if name == "huggingface":
+        return HuggingFaceBackend()
+    raise ValueError(f"Unknown embedding backend: {name}")
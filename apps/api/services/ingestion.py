@@ -0,0 +1,206 @@
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import select
+from database import SessionLocal, IngestionJob, File as FileModel
+from services.extraction import extractor
+from services.pipeline import run_pipeline, PipelineProgress
+from services.vector_store import vector_store
+
+# Number of background threads draining the ingestion_jobs table in this process.
+# Set to 0 to disable in-process workers and run `python scripts/ingestion_worker.py` separately.
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+# How often idle workers re-check the table for jobs enqueued by other processes
+INGESTION_POLL_INTERVAL = float(os.getenv("INGESTION_POLL_INTERVAL", "5"))
+# Jobs stuck in a running state for longer than this are assumed orphaned (worker crashed)
+INGESTION_STALE_AFTER = int(os.getenv("INGESTION_STALE_AFTER", "1800"))
+
+RUNNING_STATUSES = ("extracting", "embedding")
+
+
+class IngestionQueue:
+    """
+    Persistent ingestion queue backed by the `ingestion_jobs` table.
+    Uploads enqueue a job and return immediately; a pool of worker threads
+    claims queued jobs (SELECT ... FOR UPDATE SKIP LOCKED, so several API
+    processes can share the table) and runs extract -> chunk -> embed -> index.
+    """
+
+    def __init__(self, num_workers: int = INGESTION_WORKERS, poll_interval: float = INGESTION_POLL_INTERVAL):
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def enqueue(self, db, file_id: str) -> IngestionJob:
+        job = IngestionJob(id=str(uuid.uuid4()), file_id=file_id, status="queued")
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        # Wake an idle worker instead of waiting for the next poll
+        self._wakeup.set()
+        return job
+
+    def start(self):
+        if self._threads or self.num_workers <= 0:
+            return
+        self._stop.clear()
+        self._requeue_stale_jobs()
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"ingestion-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"Started {self.num_workers} ingestion workers.")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def _requeue_stale_jobs(self):
+        db = SessionLocal()
+        try:
+            cutoff = datetime.now() - timedelta(seconds=INGESTION_STALE_AFTER)
+            stale = db.query(IngestionJob).filter(
+                IngestionJob.status.in_(RUNNING_STATUSES),
+                IngestionJob.started_at < cutoff
+            ).all()
+            for job in stale:
+                job.status = "queued"
+            db.commit()
+            if stale:
+                print(f"Re-queued {len(stale)} stale ingestion jobs.")
+        except Exception as e:
+            print(f"Failed to re-queue stale ingestion jobs: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _claim_next(self) -> Optional[str]:
+        """
+        Atomically move the oldest queued job to 'extracting' and return its id.
+        """
+        db = SessionLocal()
+        try:
+            stmt = (
+                select(IngestionJob)
+                .where(IngestionJob.status == "queued")
+                .order_by(IngestionJob.created_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            job = db.execute(stmt).scalars().first()
+            if not job:
+                return None
+            job.status = "extracting"
+            job.started_at = datetime.now()
+            job.attempts = (job.attempts or 0) + 1
+            db.commit()
+            return job.id
+        finally:
+            db.close()
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                job_id = self._claim_next()
+            except Exception as e:
+                print(f"Ingestion worker failed to claim job: {e}")
+                job_id = None
+
+            if job_id is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self.process(job_id)
+
+    def process(self, job_id: str):
+        db = SessionLocal()
+        job = db.get(IngestionJob, job_id)
+        try:
+            file = job.file
+
+            job.page_count = extractor.page_count(file.file_path)
+            # Drop chunks left behind by an earlier, interrupted attempt
+            vector_store.delete_file(file.id)
+
+            def on_progress(progress: PipelineProgress):
+                # Pages stream through extract -> chunk -> embed, so stages overlap;
+                # once the first batch is committed the job is in the embedding stage.
+                job.status = "embedding"
+                job.pages_processed = progress.pages
+                job.chunk_count = progress.chunks
+                job.extract_seconds = progress.extract_seconds
+                job.embed_seconds = progress.embed_seconds
+                job.embedding_cache_hits = progress.cache_hits
+                job.embedding_cache_misses = progress.cache_misses
+                db.commit()
+
+            progress = run_pipeline(
+                file.file_path,
+                {"file_id": file.id, "chat_id": file.chat_id, "filename": file.filename},
+                on_progress=on_progress
+            )
+
+            job.pages_processed = progress.pages
+            job.chunk_count = progress.chunks
+            job.extract_seconds = progress.extract_seconds
+            job.embed_seconds = progress.embed_seconds
+            job.embedding_cache_hits = progress.cache_hits
+            job.embedding_cache_misses = progress.cache_misses
+            job.status = "indexed"
+            job.finished_at = datetime.now()
+            db.commit()
+            print(
+                f"Indexed {progress.chunks} chunks in {progress.batches} batches for file {file.filename} "
+                f"(embedding cache hit rate: {progress.cache_hit_rate:.0%})"
+            )
+        except Exception as e:
+            print(f"Indexing failed for job {job_id}: {e}")
+            db.rollback()
+            try:
+                vector_store.delete_file(job.file_id)
+            except Exception as cleanup_error:
+                print(f"Failed to clean up chunks for job {job_id}: {cleanup_error}")
+            job.status = "failed"
+            job.error = str(e)
+            job.finished_at = datetime.now()
+            db.commit()
+            try:
+                self.promote_duplicate(db, job.file_id)
+            except Exception as promote_error:
+                print(f"Failed to re-queue duplicates of file {job.file_id}: {promote_error}")
+                db.rollback()
+        finally:
+            db.close()
+
+    def promote_duplicate(self, db, file_id: str):
+        """
+        Uploads deduplicated against a file whose indexing failed were never tried
+        themselves. The oldest becomes the canonical file (the others are re-pointed
+        to it) and is queued, so their status follows a fresh attempt.
+        """
+        duplicates = (
+            db.query(FileModel)
+            .filter(FileModel.duplicate_of == file_id)
+            .order_by(FileModel.uploaded_at)
+            .all()
+        )
+        if not duplicates:
+            return
+        promoted = duplicates[0]
+        promoted.duplicate_of = None
+        for duplicate in duplicates[1:]:
+            duplicate.duplicate_of = promoted.id
+        self.enqueue(db, promoted.id)
+        print(f"Re-queued {len(duplicates)} duplicate(s) of failed file {file_id} as {promoted.id}")
+
+
+# Singleton
+ingestion_queue = IngestionQueue()
@@ -0,0 +1,321 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from services.vector_backend import VectorBackend, EmbedFn
+from services.vector_index import VECTOR_METRIC, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH
+
+# Directory holding the HNSW graph (index.bin) and the chunk store (chunks.db)
+LOCAL_ANN_PATH = os.getenv("LOCAL_ANN_PATH", "vector_index")
+# Initial graph capacity; grows by doubling
+LOCAL_ANN_CAPACITY = int(os.getenv("LOCAL_ANN_CAPACITY", "10000"))
+# Write the graph to disk after this many unsaved changes (and on shutdown)
+LOCAL_ANN_SAVE_EVERY = int(os.getenv("LOCAL_ANN_SAVE_EVERY", "1000"))
+# Scoped searches over at most this many chunks are exact instead of a filtered graph walk
+LOCAL_ANN_EXACT_THRESHOLD = int(os.getenv("LOCAL_ANN_EXACT_THRESHOLD", "2000"))
+# Bytes of chunks.db served through mmap instead of read() syscalls
+LOCAL_ANN_MMAP_SIZE = int(os.getenv("LOCAL_ANN_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+INDEX_FILE = "index.bin"
+STORE_FILE = "chunks.db"
+
+# VECTOR_METRIC -> hnswlib space; smaller distance is closer in all three
+SPACES = {"l2": "l2", "cosine": "cosine", "inner_product": "ip"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    file_id TEXT,
+    chat_id TEXT,
+    embedding BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_chunks_file_id ON chunks (file_id);
+CREATE INDEX IF NOT EXISTS ix_chunks_chat_id ON chunks (chat_id);
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class LocalAnnBackend(VectorBackend):
+    """
+    In-process HNSW index (hnswlib) with chunks and their vectors in SQLite.
+
+    chunks.db is the source of truth and is read through mmap; index.bin is a derived
+    graph saved periodically and reconciled with chunks.db on load, so a crash between
+    saves only costs re-inserting the unsaved vectors. Chunk ids are never reused
+    (AUTOINCREMENT), which keeps graph labels and rows in step across deletes.
+
+    Only the process that owns the backend sees new vectors in its graph, so run
+    ingestion workers inside the API process (not `scripts/ingestion_worker.py`).
+    Full-text / hybrid search is Postgres-only; searches here are always vector.
+    """
+
+    name = "local"
+
+    def __init__(self, model_name: str, dimension: int = 384, path: str = LOCAL_ANN_PATH, metric: str = VECTOR_METRIC):
+        import hnswlib
+
+        self._hnswlib = hnswlib
+        self.model_name = model_name
+        self.dimension = dimension
+        self.path = path
+        self.space = SPACES[metric]
+        self._lock = threading.RLock()
+        self._unsaved = 0
+        self._open()
+
+    # --- storage ---
+
+    def _open(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.path, STORE_FILE), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={LOCAL_ANN_MMAP_SIZE}")
+        self._conn.executescript(SCHEMA)
+        self._check_settings()
+
+        self._index = self._hnswlib.Index(space=self.space, dim=self.dimension)
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if os.path.exists(index_path):
+            self._index.load_index(index_path, allow_replace_deleted=True)
+        else:
+            self._index.init_index(
+                max_elements=LOCAL_ANN_CAPACITY,
+                M=HNSW_M,
+                ef_construction=HNSW_EF_CONSTRUCTION,
+                allow_replace_deleted=True
+            )
+        self._index.set_ef(HNSW_EF_SEARCH)
+        self._reconcile()
+
+    def _check_settings(self):
+        expected = {"model_name": self.model_name, "dimension": str(self.dimension), "space": self.space}
+        stored = dict(self._conn.execute("SELECT key, value FROM settings").fetchall())
+        for key, value in expected.items():
+            if key in stored and stored[key] != value:
+                raise ValueError(
+                    f"Local vector index at {self.path} was built with {key}={stored[key]}, not {value}; "
+                    "re-ingest into a new LOCAL_ANN_PATH"
+                )
+        self._conn.executemany("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", expected.items())
+        self._conn.commit()
+
+    def _reconcile(self):
+        """
+        Bring the graph in line with chunks.db after a crash or a missing index file.
+        """
+        stored_ids = {row[0] for row in self._conn.execute("SELECT id FROM chunks")}
+        indexed_ids = set(self._index.get_ids_list())
+
+        missing = sorted(stored_ids - indexed_ids)
+        for start in range(0, len(missing), LOCAL_ANN_SAVE_EVERY):
+            ids = missing[start:start + LOCAL_ANN_SAVE_EVERY]
+            placeholders = ",".join("?" * len(ids))
+            rows = self._conn.execute(
+                f"SELECT id, embedding FROM chunks WHERE id IN ({placeholders})", ids
+            ).fetchall()
+            vectors = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+            self._add_to_index(vectors, [row_id for row_id, _ in rows])
+
+        dropped = sum(self._mark_deleted(label) for label in indexed_ids - stored_ids)
+
+        if missing or dropped:
+            print(f"Local vector index: restored {len(missing)} vectors, dropped {dropped}.")
+            self._save()
+
+    def _add_to_index(self, vectors: np.ndarray, ids: List[int]):
+        needed = self._index.get_current_count() + len(ids)
+        if needed > self._index.get_max_elements():
+            self._index.resize_index(max(needed, self._index.get_max_elements() * 2))
+        self._index.add_items(vectors, ids, replace_deleted=True)
+
+    def _mark_deleted(self, label: int) -> bool:
+        try:
+            self._index.mark_deleted(label)
+            return True
+        except RuntimeError:
+            # Already deleted
+            return False
+
+    def _save(self):
+        self._index.save_index(os.path.join(self.path, INDEX_FILE))
+        self._unsaved = 0
+
+    def _record_changes(self, count: int):
+        self._unsaved += count
+        if self._unsaved >= LOCAL_ANN_SAVE_EVERY:
+            self._save()
+
+    def close(self):
+        with self._lock:
+            if self._unsaved:
+                self._save()
+            self._conn.close()
+
+    # --- VectorBackend ---
+
+    def add_documents(self, documents: List[Dict], embed_fn: EmbedFn) -> Dict:
+        if not documents:
+            return {"added": 0, "cache_hits": 0, "cache_misses": 0}
+
+        vectors = np.asarray(embed_fn([doc['text'] for doc in documents]), dtype=np.float32)
+        with self._lock:
+            ids = []
+            with self._conn:
+                for doc, vector in zip(documents, vectors):
+                    metadata = doc.get('metadata', {})
+                    cursor = self._conn.execute(
+                        "INSERT INTO chunks (text, metadata, file_id, chat_id, embedding) VALUES (?, ?, ?, ?, ?)",
+                        (doc['text'], json.dumps(metadata), metadata.get('file_id'), metadata.get('chat_id'), vector.tobytes())
+                    )
+                    ids.append(cursor.lastrowid)
+            # Rows are committed first: if we die before the graph is saved, _reconcile re-adds them
+            self._add_to_index(vectors, ids)
+            self._record_changes(len(ids))
+
+        print(f"Added {len(ids)} documents to local vector index.")
+        return {"added": len(ids), "cache_hits": 0, "cache_misses": len(ids)}
+
+    def delete_file(self, file_id: str) -> int:
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute("SELECT id FROM chunks WHERE file_id = ?", (file_id,))]
+            if not ids:
+                return 0
+            with self._conn:
+                self._conn.execute("DELETE FROM chunks WHERE file_id = ?", (file_id,))
+            for label in ids:
+                self._mark_deleted(label)
+            self._record_changes(len(ids))
+            return len(ids)
+
+    def assign_chat(self, file_ids: List[str], chat_id: str) -> int:
+        if not file_ids:
+            return 0
+        placeholders = ",".join("?" * len(file_ids))
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"UPDATE chunks SET chat_id = ? WHERE file_id IN ({placeholders}) AND chat_id IS NULL",
+                [chat_id, *file_ids]
+            )
+            return cursor.rowcount
+
+    def _scoped_ids(self, file_ids: Optional[List[str]], chat_id: Optional[str]) -> List[int]:
+        clauses, params = [], []
+        if file_ids is not None:
+            clauses.append(f"file_id IN ({','.join('?' * len(file_ids))})")
+            params.extend(file_ids)
+        if chat_id is not None:
+            clauses.append("chat_id = ?")
+            params.append(chat_id)
+        rows = self._conn.execute(f"SELECT id FROM chunks WHERE {' AND '.join(clauses)}", params)
+        return [row[0] for row in rows]
+
+    def _exact(self, query: np.ndarray, ids: List[int], k: int):
+        vectors = self._index.get_items(ids, return_type="numpy")
+        if self.space == "l2":
+            distances = ((vectors - query) ** 2).sum(axis=1)
+        else:
+            if self.space == "cosine":
+                # hnswlib stores cosine vectors normalized
+                query = query / (np.linalg.norm(query) or 1.0)
+            distances = 1.0 - vectors @ query
+        order = np.argsort(distances)[:k]
+        return [ids[i] for i in order], distances[order]
+
+    def search(
+        self,
+        query: str,
+        query_embedding: Sequence[float],
+        k: int,
+        file_ids: Optional[List[str]] = None,
+        chat_id: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        **options
+    ) -> List[Dict]:
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        with self._lock:
+            if file_ids is not None or chat_id is not None:
+                if file_ids is not None and not file_ids:
+                    return []
+                allowed = self._scoped_ids(file_ids, chat_id)
+                if not allowed:
+                    return []
+                k = min(k, len(allowed))
+            else:
+                allowed = None
+                k = min(k, self._conn.execute("SELECT count(*) FROM chunks").fetchone()[0])
+            if k == 0:
+                return []
+
+            if allowed is not None and len(allowed) <= LOCAL_ANN_EXACT_THRESHOLD:
+                labels, distances = self._exact(vector, allowed, k)
+            else:
+                allowed_set = set(allowed) if allowed is not None else None
+                self._index.set_ef(max(ef_search or HNSW_EF_SEARCH, k))
+                try:
+                    found, dists = self._index.knn_query(
+                        vector, k=k, filter=allowed_set.__contains__ if allowed_set is not None else None
+                    )
+                    labels, distances = [int(label) for label in found[0]], dists[0]
+                except RuntimeError:
+                    # The filtered walk ran out of candidates before finding k matches
+                    if allowed is None:
+                        allowed = [row[0] for row in self._conn.execute("SELECT id FROM chunks")]
+                    labels, distances = self._exact(vector, allowed, k)
+                finally:
+                    self._index.set_ef(HNSW_EF_SEARCH)
+
+            placeholders = ",".join("?" * len(labels))
+            rows = {
+                row[0]: row for row in self._conn.execute(
+                    f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})", labels
+                )
+            }
+
+        output = []
+        for label, dist in zip(labels, distances):
+            row = rows.get(label)
+            if row is None:
+                continue
+            output.append({
+                "chunk_id": label,
+                "text": row[1],
+                **json.loads(row[2]),
+                "distance": float(dist)
+            })
+        return output
+
+    def snapshot(self, path: str) -> str:
+        """
+        Consistent copy of the graph and chunk store, safe to take while serving.
+        """
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            self._index.save_index(os.path.join(path, INDEX_FILE))
+            target = sqlite3.connect(os.path.join(path, STORE_FILE))
+            try:
+                self._conn.backup(target)
+            finally:
+                target.close()
+        return path
+
+    def restore(self, path: str):
+        for name in (INDEX_FILE, STORE_FILE):
+            if not os.path.exists(os.path.join(path, name)):
+                raise FileNotFoundError(f"Snapshot at {path} is missing {name}")
+
+        with self._lock:
+            self._conn.close()
+            for name in (INDEX_FILE, STORE_FILE, f"{STORE_FILE}-wal", f"{STORE_FILE}-shm"):
+                target = os.path.join(self.path, name)
+                if os.path.exists(target):
+                    os.remove(target)
+            for name in (INDEX_FILE, STORE_FILE):
+                shutil.copy2(os.path.join(path, name), os.path.join(self.path, name))
+            self._unsaved = 0
+            self._open()
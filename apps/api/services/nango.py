@@ -1,8 +1,69 @@
+import asyncio
 import os
-import requests
-from typing import Optional
+import time
+from dataclasses import dataclass
+from datetime import datetime
+import httpx
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+# Upper bound on any single Nango API call; chat requests wait on these
+NANGO_TIMEOUT = float(os.getenv("NANGO_TIMEOUT", "10"))
+# How long a (user, provider) -> connection id lookup is reused; misses expire sooner
+# so a freshly connected account shows up quickly
+NANGO_CONNECTION_TTL = float(os.getenv("NANGO_CONNECTION_TTL", "300"))
+NANGO_MISSING_CONNECTION_TTL = float(os.getenv("NANGO_MISSING_CONNECTION_TTL", "30"))
+# Tokens are refreshed this many seconds before they expire, and never served in the last NANGO_EXPIRY_SKEW
+NANGO_REFRESH_MARGIN = float(os.getenv("NANGO_REFRESH_MARGIN", "120"))
+NANGO_EXPIRY_SKEW = float(os.getenv("NANGO_EXPIRY_SKEW", "30"))
+# Credentials without an expiry (API keys) are re-read after this long
+NANGO_TOKEN_TTL = float(os.getenv("NANGO_TOKEN_TTL", "900"))
+# Tokens unused for this long stop being refreshed in the background
+NANGO_KEEP_WARM = float(os.getenv("NANGO_KEEP_WARM", "3600"))
+# Don't re-fetch the same token more often than this, even if Nango hands back one close to expiry
+NANGO_MIN_REFRESH_INTERVAL = float(os.getenv("NANGO_MIN_REFRESH_INTERVAL", "10"))
+NANGO_PAGE_SIZE = int(os.getenv("NANGO_PAGE_SIZE", "100"))
+NANGO_MAX_PAGES = 50
+
+
+@dataclass
+class _CachedConnection:
+    connection_id: Optional[str]
+    expires_at: float
+
+
+@dataclass
+class _CachedToken:
+    access_token: str
+    # Wall-clock seconds: start refreshing at refresh_at, stop serving at serve_until
+    refresh_at: float
+    serve_until: float
+    last_used: float
+
+
+def _parse_expiry(value) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def _end_user_id(conn: dict) -> Optional[str]:
+    # Structure: "end_user": { "id": "..." }, or just a string in some versions
+    end_user = conn.get("end_user") or {}
+    if isinstance(end_user, dict):
+        return end_user.get("id")
+    return end_user
+
 
 class NangoService:
+    """
+    Nango API client. Connection ids and access tokens are cached per (user, provider)
+    and (connection, provider); tokens are refreshed in the background before they
+    expire, so chat requests normally resolve credentials without a network call.
+    """
+
     def __init__(self, secret_key: Optional[str] = None, base_url: str = "https://api.nango.dev"):
         self.secret_key = secret_key or os.getenv("NANGO_SECRET_KEY")
         self.base_url = base_url
@@ -11,51 +72,111 @@ class NangoService:
             print(f"DEBUG: Current CWD: {os.getcwd()}")
             print(f"DEBUG: .env exists in CWD? {os.path.exists('.env')}")
             print(f"DEBUG: All Env Keys: {list(os.environ.keys())}")
+        self._client: Optional[httpx.AsyncClient] = None
+        self._connections: Dict[Tuple[str, str], _CachedConnection] = {}
+        self._tokens: Dict[Tuple[str, str], _CachedToken] = {}
+        # One in-flight Nango call per cache key, shared by concurrent requests
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+        self._refresh_timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # One pooled client for the process, so calls reuse TLS connections to Nango
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=NANGO_TIMEOUT,
+                headers={"Authorization": f"Bearer {self.secret_key}"},
+                limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60)
+            )
+        return self._client
 
-    def get_connection_for_user(self, user_id: str, provider_config_key: str) -> Optional[str]:
+    async def aclose(self):
+        for timer in self._refresh_timers.values():
+            timer.cancel()
+        self._refresh_timers.clear()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _start(self, key: Tuple, fetch: Callable[[], Awaitable]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _single_flight(self, key: Tuple, fetch: Callable[[], Awaitable]):
+        # A cancelled waiter (client disconnect) must not cancel the shared call
+        return await asyncio.shield(self._start(key, fetch))
+
+    def invalidate_user(self, user_id: str):
+        """
+        Forget cached connection lookups for a user, e.g. when they start connecting an account.
+        """
+        for key in [key for key in self._connections if key[0] == user_id]:
+            del self._connections[key]
+
+    # --- connections ---
+
+    async def get_connection_for_user(self, user_id: str, provider_config_key: str) -> Optional[str]:
         """
         Finds a connection ID for a given user and provider.
         """
         if not self.secret_key:
             return None
-            
-        url = f"{self.base_url}/connection"
-        headers = {"Authorization": f"Bearer {self.secret_key}"}
-        
+
+        cached = self._connections.get((user_id, provider_config_key))
+        if cached and cached.expires_at > time.time():
+            return cached.connection_id
+
+        return await self._single_flight(
+            ("connections", user_id, provider_config_key),
+            lambda: self._fetch_connections(user_id, provider_config_key)
+        )
+
+    async def _fetch_connections(self, user_id: str, provider_config_key: str) -> Optional[str]:
+        found: Dict[str, str] = {}
+        seen = set()
         try:
-            # We fetch all (pagination might be needed in prod, but fine for now)
-            # API might support filtering ?end_user_id=... but let's filter in memory to be safe and quick
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            connections = data.get("connections", [])
-            
-            for conn in connections:
-                # Check provider
-                if conn.get("provider_config_key") != provider_config_key:
-                    continue
-                
-                # Check user
-                # Structure: "end_user": { "id": "..." }
-                end_user = conn.get("end_user", {})
-                if isinstance(end_user, dict) and end_user.get("id") == user_id:
-                     return conn.get("connection_id")
-                elif end_user == user_id: # Handle if it's just a string in some versions
-                     return conn.get("connection_id")
-                     
-            return None
+            # Filter by end user on the server and page through the (normally tiny) result
+            for page in range(NANGO_MAX_PAGES):
+                response = await self._get_client().get(
+                    "/connection",
+                    params={"endUserId": user_id, "limit": NANGO_PAGE_SIZE, "page": page}
+                )
+                response.raise_for_status()
+                connections = response.json().get("connections", [])
+                new = [conn for conn in connections if conn.get("connection_id") not in seen]
+                for conn in new:
+                    seen.add(conn.get("connection_id"))
+                    # Older API versions ignore endUserId, so check the owner here too
+                    if _end_user_id(conn) == user_id:
+                        found.setdefault(conn.get("provider_config_key"), conn.get("connection_id"))
+                if len(connections) < NANGO_PAGE_SIZE or not new:
+                    break
         except Exception as e:
             print(f"Failed to list Nango connections: {e}")
             return None
 
-    def get_connection_token(self, connection_id: str, provider_config_key: str) -> Optional[str]:
+        # One listing answers every provider for this user
+        now = time.time()
+        for provider, connection_id in found.items():
+            self._connections[(user_id, provider)] = _CachedConnection(connection_id, now + NANGO_CONNECTION_TTL)
+        if provider_config_key not in found:
+            self._connections[(user_id, provider_config_key)] = _CachedConnection(None, now + NANGO_MISSING_CONNECTION_TTL)
+        return found.get(provider_config_key)
+
+    # --- tokens ---
+
+    async def get_connection_token(self, connection_id: str, provider_config_key: str) -> Optional[str]:
         """
         Fetch the access token for a given connection from Nango.
-        
+
         Args:
             connection_id: The unique ID of the connection (e.g. user ID).
             provider_config_key: The integration key (e.g. 'google-drive').
-            
+
         Returns:
             The access token string, or None if failed.
         """
@@ -63,49 +184,100 @@ class NangoService:
             print("Error: NANGO_SECRET_KEY not set.")
             return None
 
-        url = f"{self.base_url}/connection/{connection_id}"
-        headers = {
-            "Authorization": f"Bearer {self.secret_key}"
-        }
-        params = {
-            "provider_config_key": provider_config_key
-        }
+        key = (connection_id, provider_config_key)
+        now = time.time()
+        cached = self._tokens.get(key)
+        if cached and now < cached.serve_until:
+            cached.last_used = now
+            if now >= cached.refresh_at:
+                # Still valid: serve it and refresh off the request path
+                self._refresh_in_background(key)
+            return cached.access_token
+
+        return await self._single_flight(("token",) + key, lambda: self._fetch_token(connection_id, provider_config_key))
 
+    async def _fetch_token(self, connection_id: str, provider_config_key: str) -> Optional[str]:
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = await self._get_client().get(
+                f"/connection/{connection_id}",
+                params={"provider_config_key": provider_config_key}
+            )
             response.raise_for_status()
             data = response.json()
-            # Depending on Nango API version, token location might vary.
-            # Usually: credentials -> access_token
-            return data.get("credentials", {}).get("access_token")
         except Exception as e:
             print(f"Failed to fetch Nango token: {e}")
             return None
 
-    def create_connect_session(self, user_id: str) -> Optional[str]:
+        # Depending on Nango API version, token location might vary.
+        # Usually: credentials -> access_token
+        credentials = data.get("credentials", {})
+        access_token = credentials.get("access_token")
+        if not access_token:
+            return None
+
+        key = (connection_id, provider_config_key)
+        now = time.time()
+        expires_at = _parse_expiry(credentials.get("expires_at"))
+        serve_until = expires_at - NANGO_EXPIRY_SKEW if expires_at else now + NANGO_TOKEN_TTL
+        previous = self._tokens.get(key)
+        self._tokens[key] = _CachedToken(
+            access_token=access_token,
+            refresh_at=max(now + NANGO_MIN_REFRESH_INTERVAL, serve_until - NANGO_REFRESH_MARGIN),
+            serve_until=serve_until,
+            last_used=previous.last_used if previous else now
+        )
+        self._schedule_refresh(key)
+        return access_token
+
+    def _schedule_refresh(self, key: Tuple[str, str]):
+        timer = self._refresh_timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        cached = self._tokens.get(key)
+        if cached is None:
+            return
+        delay = max(cached.refresh_at - time.time(), 0.0)
+        self._refresh_timers[key] = asyncio.get_running_loop().call_later(delay, self._refresh_in_background, key)
+
+    def _refresh_in_background(self, key: Tuple[str, str]):
+        self._refresh_timers.pop(key, None)
+        cached = self._tokens.get(key)
+        if cached is None or time.time() - cached.last_used > NANGO_KEEP_WARM:
+            # Nobody has asked for it in a while; let it lapse instead of refreshing forever
+            return
+        connection_id, provider_config_key = key
+        self._start(("token",) + key, lambda: self._fetch_token(connection_id, provider_config_key))
+
+    async def get_access_token(self, user_id: str, provider_config_key: str) -> Optional[str]:
+        """
+        Connection lookup + token fetch for a user, both served from cache when warm.
+        """
+        connection_id = await self.get_connection_for_user(user_id, provider_config_key)
+        if not connection_id:
+            return None
+        return await self.get_connection_token(connection_id, provider_config_key)
+
+    async def create_connect_session(self, user_id: str) -> Optional[str]:
         """
         Create a new Connect Session Token for the frontend.
         """
         if not self.secret_key:
             return None
-        
-        # Correct Endpoint per docs
-        url = f"{self.base_url}/connect/sessions"
-        headers = {
-            "Authorization": f"Bearer {self.secret_key}",
-            "Content-Type": "application/json"
-        }
-        
+
+        # The user is about to connect an account; don't keep serving a cached "not connected"
+        self.invalidate_user(user_id)
+
         # Correct Body per docs
-        data = { 
+        data = {
             "end_user": {
                 "id": user_id
             },
             "allowed_integrations": ["google-drive"], # Optional: Whitelist specific integration
         }
-        
+
         try:
-            response = requests.post(url, headers=headers, json=data)
+            # Correct Endpoint per docs
+            response = await self._get_client().post("/connect/sessions", json=data)
             response.raise_for_status()
             json_data = response.json()
             # Response: { "data": { "token": "...", ... } }
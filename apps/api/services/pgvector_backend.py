@@ -0,0 +1,254 @@
+import os
+from typing import List, Dict, Optional, Sequence
+from sqlalchemy import select, delete, update, func, cast, String
+from sqlalchemy.dialects.postgresql import TSQUERY
+from sqlalchemy.orm import load_only
+from database import SessionLocal, AsyncSessionLocal, DocumentChunk
+from services.embedding_cache import EmbeddingCache
+from services.bulk_copy import copy_document_chunks
+from services.vector_backend import VectorBackend, EmbedFn
+from services.vector_index import (
+    apply_search_settings,
+    apply_search_settings_async,
+    distance,
+    quantized_distance,
+    VECTOR_QUANTIZATION,
+    QUANTIZED_OVERSAMPLE,
+)
+
+# Batches at least this large are bulk-loaded with binary COPY instead of ORM INSERTs
+COPY_THRESHOLD = int(os.getenv("COPY_THRESHOLD", "32"))
+# Default retrieval: 'hybrid' (vector + Postgres full-text, fused by rank) or 'vector'
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+# Each ranked list contributes this many candidates per requested result before fusion
+HYBRID_CANDIDATE_MULTIPLIER = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "4"))
+# Reciprocal rank fusion constant; larger values flatten the weight of top ranks
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+class PgVectorBackend(VectorBackend):
+    """
+    Chunks live in Postgres (document_chunks) and are searched with pgvector,
+    optionally fused with full-text ranking.
+    """
+
+    name = "pgvector"
+
+    def __init__(self, model_name: str):
+        self.embedding_cache = EmbeddingCache(model_name)
+
+    def add_documents(self, documents: List[Dict], embed_fn: EmbedFn) -> Dict:
+        """
+        'file_id' and 'chat_id' in metadata are also stored as indexed columns.
+        """
+        if not documents:
+            return {"added": 0, "cache_hits": 0, "cache_misses": 0}
+
+        texts = [doc['text'] for doc in documents]
+
+        db = SessionLocal()
+        try:
+            # Generate embeddings using the local model, skipping texts already in the cache
+            embeddings, cache_hits = self.embedding_cache.embed_documents(db, texts, embed_fn)
+
+            if len(documents) >= COPY_THRESHOLD:
+                added = copy_document_chunks(db, documents, embeddings)
+            else:
+                added = self._insert_chunks(db, documents, embeddings)
+            db.commit()
+            print(f"Added {added} documents to Postgres vector store (embedding cache hits: {cache_hits}/{added}).")
+            return {"added": added, "cache_hits": cache_hits, "cache_misses": added - cache_hits}
+        except Exception as e:
+            print(f"Error adding documents: {e}")
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _insert_chunks(self, db, documents: List[Dict], embeddings) -> int:
+        chunks = []
+        for i, doc in enumerate(documents):
+            metadata = doc.get('metadata', {})
+            chunk = DocumentChunk(
+                text=doc['text'],
+                metadata_=metadata,
+                embedding=embeddings[i],
+                file_id=metadata.get('file_id'),
+                chat_id=metadata.get('chat_id')
+            )
+            chunks.append(chunk)
+
+        db.add_all(chunks)
+        return len(chunks)
+
+    def delete_file(self, file_id: str) -> int:
+        """
+        Remove every chunk indexed for a file. Returns the number of deleted chunks.
+        """
+        db = SessionLocal()
+        try:
+            stmt = delete(DocumentChunk).where(DocumentChunk.file_id == file_id)
+            deleted = db.execute(stmt).rowcount
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    def assign_chat(self, file_ids: List[str], chat_id: str) -> int:
+        """
+        Tag chunks of files that were uploaded before their chat existed.
+        """
+        db = SessionLocal()
+        try:
+            stmt = update(DocumentChunk).where(
+                DocumentChunk.file_id.in_(file_ids),
+                DocumentChunk.chat_id.is_(None)
+            ).values(chat_id=chat_id)
+            updated = db.execute(stmt).rowcount
+            db.commit()
+            return updated
+        finally:
+            db.close()
+
+    def _scope_filters(self, file_ids: Optional[List[str]], chat_id: Optional[str]) -> List:
+        filters = []
+        if file_ids is not None:
+            filters.append(DocumentChunk.file_id.in_(file_ids))
+        if chat_id is not None:
+            filters.append(DocumentChunk.chat_id == chat_id)
+        return filters
+
+    def _result_columns(self):
+        # Don't ship embeddings and tsvectors back to Python; results only need text and metadata
+        return load_only(DocumentChunk.id, DocumentChunk.text, DocumentChunk.metadata_)
+
+    def _vector_candidates(self, query_embedding, n: int, filters: List, oversample: Optional[int] = None):
+        """
+        Subquery of the `n` nearest chunk ids with their full-precision distance.
+        With VECTOR_QUANTIZATION enabled this is two-stage: n * oversample candidates come
+        from the compressed (halfvec / binary) index, then are re-ranked exactly on `embedding`.
+        """
+        # Distance matches VECTOR_METRIC (L2 by default) so the ANN index is used -> smaller is better
+        dist = distance(query_embedding).label("dist")
+        if VECTOR_QUANTIZATION == "none":
+            return select(DocumentChunk.id, dist).where(*filters).order_by(dist).limit(n).subquery()
+
+        coarse = select(DocumentChunk.id).where(*filters).order_by(
+            quantized_distance(query_embedding)
+        ).limit(n * (oversample or QUANTIZED_OVERSAMPLE)).subquery()
+        return (
+            select(DocumentChunk.id, dist)
+            .join(coarse, DocumentChunk.id == coarse.c.id)
+            .order_by(dist)
+            .limit(n)
+            .subquery()
+        )
+
+    def _vector_statement(self, query_embedding, k: int, filters: List, oversample: Optional[int] = None):
+        nearest = self._vector_candidates(query_embedding, k, filters, oversample)
+        return (
+            select(DocumentChunk, nearest.c.dist)
+            .options(self._result_columns())
+            .join(nearest, DocumentChunk.id == nearest.c.id)
+            .order_by(nearest.c.dist)
+        )
+
+    def _hybrid_statement(self, query: str, query_embedding, k: int, filters: List, oversample: Optional[int] = None):
+        """
+        Vector and full-text candidates in one statement, merged with reciprocal rank fusion:
+        score = sum over lists of 1 / (RRF_K + rank).
+        """
+        candidates = max(k * HYBRID_CANDIDATE_MULTIPLIER, k)
+
+        vector_inner = self._vector_candidates(query_embedding, candidates, filters, oversample)
+        vector_hits = select(
+            vector_inner.c.id,
+            func.row_number().over(order_by=vector_inner.c.dist).label("rank")
+        ).cte("vector_hits")
+
+        # OR the query terms together (plainto_tsquery ANDs them), using the same parser as the column
+        ts_query = cast(func.replace(cast(func.plainto_tsquery("simple", query), String), "&", "|"), TSQUERY)
+        lexical_score = func.ts_rank_cd(DocumentChunk.text_tsv, ts_query).label("lexical_score")
+        lexical_inner = select(DocumentChunk.id, lexical_score).where(
+            DocumentChunk.text_tsv.op("@@")(ts_query), *filters
+        ).order_by(lexical_score.desc()).limit(candidates).subquery()
+        lexical_hits = select(
+            lexical_inner.c.id,
+            func.row_number().over(order_by=lexical_inner.c.lexical_score.desc()).label("rank")
+        ).cte("lexical_hits")
+
+        fused = select(
+            func.coalesce(vector_hits.c.id, lexical_hits.c.id).label("id"),
+            (
+                func.coalesce(1.0 / (RRF_K + vector_hits.c.rank), 0.0)
+                + func.coalesce(1.0 / (RRF_K + lexical_hits.c.rank), 0.0)
+            ).label("score")
+        ).select_from(
+            vector_hits.join(lexical_hits, vector_hits.c.id == lexical_hits.c.id, full=True)
+        ).subquery()
+
+        return (
+            select(DocumentChunk, fused.c.score)
+            .options(self._result_columns())
+            .join(fused, DocumentChunk.id == fused.c.id)
+            .order_by(fused.c.score.desc())
+            .limit(k)
+        )
+
+    def _search_statement(self, query: str, query_embedding, k: int, filters: List, mode: Optional[str], oversample: Optional[int]):
+        if (mode or SEARCH_MODE) == "hybrid":
+            return self._hybrid_statement(query, query_embedding, k, filters, oversample), "score"
+        return self._vector_statement(query_embedding, k, filters, oversample), "distance"
+
+    def _format_results(self, results, score_key: str) -> List[Dict]:
+        output = []
+        for chunk, score in results:
+            output.append({
+                "chunk_id": chunk.id,
+                "text": chunk.text,
+                **chunk.metadata_,
+                score_key: float(score)
+            })
+        return output
+
+    def search(
+        self,
+        query: str,
+        query_embedding: Sequence[float],
+        k: int,
+        file_ids: Optional[List[str]] = None,
+        chat_id: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        mode: Optional[str] = None,
+        oversample: Optional[int] = None,
+        **options
+    ) -> List[Dict]:
+        db = SessionLocal()
+        try:
+            filters = self._scope_filters(file_ids, chat_id)
+            apply_search_settings(db, ef_search=ef_search, probes=probes, filtered=bool(filters))
+            stmt, score_key = self._search_statement(query, query_embedding, k, filters, mode, oversample)
+            return self._format_results(db.execute(stmt).all(), score_key)
+        finally:
+            db.close()
+
+    async def asearch(
+        self,
+        query: str,
+        query_embedding: Sequence[float],
+        k: int,
+        file_ids: Optional[List[str]] = None,
+        chat_id: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        mode: Optional[str] = None,
+        oversample: Optional[int] = None,
+        **options
+    ) -> List[Dict]:
+        # Same statements over asyncpg, so a slow query doesn't hold a threadpool worker
+        async with AsyncSessionLocal() as db:
+            filters = self._scope_filters(file_ids, chat_id)
+            await apply_search_settings_async(db, ef_search=ef_search, probes=probes, filtered=bool(filters))
+            stmt, score_key = self._search_statement(query, query_embedding, k, filters, mode, oversample)
+            return self._format_results((await db.execute(stmt)).all(), score_key)
@@ -0,0 +1,92 @@
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from services.extraction import extractor
+from services.vector_store import vector_store
+
+# Chunks embedded and committed together. Peak memory is proportional to this, not to document size.
+INGESTION_BATCH_SIZE = int(os.getenv("INGESTION_BATCH_SIZE", "64"))
+
+
+@dataclass
+class PipelineProgress:
+    pages: int = 0
+    chunks: int = 0
+    batches: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    # Time spent extracting and splitting vs. embedding and inserting
+    extract_seconds: float = 0.0
+    embed_seconds: float = 0.0
+
+    @property
+    def cache_hit_rate(self) -> float:
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0.0
+
+
+def iter_chunks(pages: Iterable[Dict], metadata: Dict, progress: PipelineProgress) -> Iterator[Dict]:
+    """
+    Split each page as it arrives. Chunks carry the page number alongside the file metadata.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len,
+        is_separator_regex=False,
+    )
+    for page in pages:
+        progress.pages += 1
+        for chunk in text_splitter.split_text(page["text"]):
+            yield {
+                "text": chunk,
+                "metadata": {**metadata, "page": page["page"]}
+            }
+
+
+def iter_batches(items: Iterable[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_pipeline(
+    file_path: str,
+    metadata: Dict,
+    batch_size: int = INGESTION_BATCH_SIZE,
+    on_progress: Optional[Callable[[PipelineProgress], None]] = None
+) -> PipelineProgress:
+    """
+    Streaming extract -> chunk -> embed -> insert.
+    Pages flow through the splitter lazily; chunks are embedded and committed
+    in micro-batches of `batch_size`, and `on_progress` is called after each batch.
+    """
+    progress = PipelineProgress()
+    batches = iter_batches(iter_chunks(extractor.iter_pages(file_path), metadata, progress), batch_size)
+
+    while True:
+        stage_start = time.perf_counter()
+        batch = next(batches, None)
+        progress.extract_seconds += time.perf_counter() - stage_start
+        if batch is None:
+            break
+
+        stage_start = time.perf_counter()
+        stats = vector_store.add_documents(batch)
+        progress.embed_seconds += time.perf_counter() - stage_start
+
+        progress.chunks += len(batch)
+        progress.batches += 1
+        progress.cache_hits += stats["cache_hits"]
+        progress.cache_misses += stats["cache_misses"]
+        if on_progress:
+            on_progress(progress)
+
+    return progress
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import threading
+from typing import Dict, List, Optional
+from cachetools import LRUCache
+from services.embedding_cache import normalize_text
+
+# Re-rank retrieved chunks with a cross-encoder before they go into the prompt
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates over-fetched from the vector store, and how many survive re-ranking
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "3"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+# (query, chunk) scores kept in memory
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "10000"))
+
+
+class CrossEncoderReranker:
+    """
+    Scores (query, chunk) pairs with a small CPU cross-encoder in one batch.
+    Scores are cached by (query hash, chunk id), so repeated questions over the
+    same document only score new candidates.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, cache_size: int = RERANK_CACHE_SIZE):
+        self.model_name = model_name
+        self._model = None
+        self._cache = LRUCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        # Loaded on first use so disabled deployments never pay for it
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name)
+        return self._model
+
+    def rerank(self, query: str, candidates: List[Dict], top_k: int = RERANK_TOP_K) -> List[Dict]:
+        """
+        Returns the `top_k` candidates by cross-encoder score, each with a 'rerank_score'.
+        Candidates must carry 'chunk_id' and 'text' (as returned by VectorStore.search).
+        """
+        if not candidates:
+            return []
+
+        query_hash = hashlib.sha256(normalize_text(query).encode("utf-8")).hexdigest()
+        scores: Dict[int, float] = {}
+        to_score = []
+        with self._lock:
+            for candidate in candidates:
+                score = self._cache.get((query_hash, candidate["chunk_id"]))
+                if score is None:
+                    to_score.append(candidate)
+                else:
+                    scores[candidate["chunk_id"]] = score
+
+        if to_score:
+            pairs = [(query, candidate["text"]) for candidate in to_score]
+            new_scores = self._get_model().predict(pairs, batch_size=RERANK_BATCH_SIZE)
+            with self._lock:
+                for candidate, score in zip(to_score, new_scores):
+                    scores[candidate["chunk_id"]] = float(score)
+                    self._cache[(query_hash, candidate["chunk_id"])] = float(score)
+
+        ranked = sorted(candidates, key=lambda c: scores[c["chunk_id"]], reverse=True)[:top_k]
+        return [{**candidate, "rerank_score": scores[candidate["chunk_id"]]} for candidate in ranked]
+
+
+# Singleton
+reranker: Optional[CrossEncoderReranker] = CrossEncoderReranker() if RERANK_ENABLED else None
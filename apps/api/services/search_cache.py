@@ -0,0 +1,134 @@
+import os
+import threading
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+from cachetools import LRUCache, TTLCache
+from services.embedding_cache import normalize_text
+
+# Query embeddings kept in memory, keyed by normalized query text
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+# Search results kept per (query, scope, k, options) and for how long; 0 disables
+SEARCH_RESULT_CACHE_SIZE = int(os.getenv("SEARCH_RESULT_CACHE_SIZE", "1024"))
+SEARCH_RESULT_CACHE_TTL = float(os.getenv("SEARCH_RESULT_CACHE_TTL", "60"))
+
+Scope = Tuple[Optional[frozenset], Optional[str]]
+
+
+class SearchCache:
+    """
+    In-memory caches in front of VectorStore.search: an LRU of query embeddings and a
+    short-TTL cache of results. Result entries remember their (file_ids, chat_id) scope
+    so writes only evict the entries they could change.
+    """
+
+    def __init__(
+        self,
+        embedding_size: int = QUERY_EMBEDDING_CACHE_SIZE,
+        result_size: int = SEARCH_RESULT_CACHE_SIZE,
+        result_ttl: float = SEARCH_RESULT_CACHE_TTL
+    ):
+        self._embeddings = LRUCache(maxsize=embedding_size) if embedding_size > 0 else None
+        self._results = TTLCache(maxsize=result_size, ttl=result_ttl) if result_size > 0 and result_ttl > 0 else None
+        self._lock = threading.Lock()
+        # Bumped on every invalidation; a search that started before it doesn't store its results
+        self._generation = 0
+        self.embedding_hits = 0
+        self.embedding_misses = 0
+        self.result_hits = 0
+        self.result_misses = 0
+
+    @staticmethod
+    def scope(file_ids: Optional[Iterable[str]], chat_id: Optional[str]) -> Scope:
+        return (frozenset(file_ids) if file_ids is not None else None, chat_id)
+
+    def cached_query_embedding(self, query: str) -> Optional[List[float]]:
+        if self._embeddings is None:
+            return None
+        with self._lock:
+            embedding = self._embeddings.get(normalize_text(query))
+            if embedding is not None:
+                self.embedding_hits += 1
+            else:
+                self.embedding_misses += 1
+            return embedding
+
+    def store_query_embedding(self, query: str, embedding: List[float]):
+        if self._embeddings is None:
+            return
+        with self._lock:
+            self._embeddings[normalize_text(query)] = embedding
+
+    def query_embedding(self, query: str, embed_fn: Callable[[str], List[float]]) -> List[float]:
+        embedding = self.cached_query_embedding(query)
+        if embedding is None:
+            embedding = embed_fn(query)
+            self.store_query_embedding(query, embedding)
+        return embedding
+
+    def result_key(self, query: str, scope: Scope, k: int, options: Sequence[Hashable]) -> Tuple:
+        return (normalize_text(query), scope, k, tuple(options))
+
+    def get_results(self, key: Tuple) -> Tuple[Optional[List[Dict]], int]:
+        """
+        Returns (cached results or None, generation to pass back to put_results).
+        """
+        with self._lock:
+            generation = self._generation
+            if self._results is None:
+                return None, generation
+            results = self._results.get(key)
+            if results is None:
+                self.result_misses += 1
+                return None, generation
+            self.result_hits += 1
+        # Callers (re-ranker, prompt building) get their own dicts
+        return [dict(r) for r in results], generation
+
+    def put_results(self, key: Tuple, results: List[Dict], generation: int):
+        with self._lock:
+            if self._results is None or generation != self._generation:
+                return
+            self._results[key] = [dict(r) for r in results]
+
+    def invalidate(self, file_ids: Iterable[Optional[str]], chat_ids: Optional[Iterable[Optional[str]]] = None):
+        """
+        Evict results whose scope could include chunks of `file_ids`.
+        chat_ids=None means the chunks' chats are unknown, so chat-scoped entries match too.
+        """
+        file_ids = set(file_ids)
+        chat_ids = set(chat_ids) if chat_ids is not None else None
+        with self._lock:
+            self._generation += 1
+            if self._results is None:
+                return
+            for key in list(self._results.keys()):
+                scope_files, scope_chat = key[1]
+                files_match = scope_files is None or not scope_files.isdisjoint(file_ids)
+                chat_match = scope_chat is None or chat_ids is None or scope_chat in chat_ids
+                if files_match and chat_match:
+                    self._results.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            if self._results is not None:
+                self._results.clear()
+
+    def stats(self) -> Dict:
+        def rate(hits: int, misses: int) -> float:
+            return hits / (hits + misses) if hits + misses else 0.0
+
+        with self._lock:
+            return {
+                "query_embeddings": {
+                    "hits": self.embedding_hits,
+                    "misses": self.embedding_misses,
+                    "hit_rate": rate(self.embedding_hits, self.embedding_misses),
+                    "size": len(self._embeddings) if self._embeddings is not None else 0,
+                },
+                "results": {
+                    "hits": self.result_hits,
+                    "misses": self.result_misses,
+                    "hit_rate": rate(self.result_hits, self.result_misses),
+                    "size": len(self._results) if self._results is not None else 0,
+                },
+            }
@@ -0,0 +1,174 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Type
+from pydantic import BaseModel, ConfigDict, Field, create_model
+from pydantic_ai import Agent
+from schemas.banking import BankingExtraction
+from services.vector_store import vector_store
+from services.agent_registry import agent_registry
+
+# Strict banking extraction: 'single' fills BankingExtraction in one call (with retries and
+# refinement), 'sections' extracts each top-level section concurrently and merges the results
+STRUCTURED_EXTRACTION_MODE = os.getenv("STRUCTURED_EXTRACTION_MODE", "single")
+# Section calls in flight across all requests, to stay inside provider rate limits.
+# The default lets one request run all of its sections at once.
+SECTION_EXTRACTION_CONCURRENCY = int(os.getenv("SECTION_EXTRACTION_CONCURRENCY", "12"))
+# Chunks retrieved for each section's own query
+SECTION_RETRIEVAL_K = int(os.getenv("SECTION_RETRIEVAL_K", "4"))
+# Times a section's output is sent back to the model when it fails validation
+SECTION_EXTRACTION_RETRIES = int(os.getenv("SECTION_EXTRACTION_RETRIES", "2"))
+
+SECTION_SYSTEM_PROMPT = (
+    "You are a strict data extraction engine. You are forbidden from speaking.\n"
+    "You fill in ONE section of a banking document extraction, using only the provided document excerpts.\n"
+    "Leave a field null if the excerpts don't state it. Do not guess.\n"
+    "In confidence_report, map each LEAF field path you filled (e.g. 'loan.mortgage.loanAmount') "
+    "to a confidence score between 0.0 and 1.0."
+)
+
+CONFIDENCE_DESCRIPTION = BankingExtraction.model_fields["confidence_report"].description
+
+_semaphore = asyncio.Semaphore(SECTION_EXTRACTION_CONCURRENCY)
+
+
+def _leaf_descriptions(model: Type[BaseModel]) -> List[str]:
+    descriptions = []
+    for name, field in model.model_fields.items():
+        nested = _model_type(field.annotation)
+        if nested is not None:
+            descriptions.extend(_leaf_descriptions(nested))
+        else:
+            descriptions.append(field.description or name)
+    return descriptions
+
+
+def _model_type(annotation) -> Optional[Type[BaseModel]]:
+    # Unwrap Optional[Model]
+    candidates = getattr(annotation, "__args__", None) or (annotation,)
+    for candidate in candidates:
+        if isinstance(candidate, type) and issubclass(candidate, BaseModel):
+            return candidate
+    return None
+
+
+class Section:
+    """
+    One top-level field of BankingExtraction with its own output model and retrieval query.
+    """
+
+    def __init__(self, name: str, section_type: Type[BaseModel]):
+        self.name = name
+        self.output_model = create_model(
+            f"{section_type.__name__}SectionExtraction",
+            __config__=ConfigDict(extra='forbid'),
+            **{
+                name: (Optional[section_type], None),
+                "confidence_report": (Optional[Dict[str, float]], Field(None, description=CONFIDENCE_DESCRIPTION)),
+            }
+        )
+        # Field labels make a better retrieval query than the section name alone
+        self.query = f"{name}: " + ", ".join(_leaf_descriptions(section_type))
+
+
+SECTIONS: List[Section] = [
+    Section(name, _model_type(field.annotation))
+    for name, field in BankingExtraction.model_fields.items()
+    if name != "confidence_report"
+]
+
+
+class SectionExtractor:
+    """
+    Runs one schema-scoped extraction per BankingExtraction section concurrently, each
+    on chunks retrieved for that section, and merges them into one validated BankingExtraction.
+    """
+
+    def __init__(self, sections: List[Section] = SECTIONS):
+        self.sections = sections
+        self._agents: Dict[str, Agent] = {}
+        self._lock = threading.Lock()
+
+    def _get_agent(self, section: Section) -> Agent:
+        # Built once per section, like the chat agents in AgentRegistry
+        agent = self._agents.get(section.name)
+        if agent is None:
+            with self._lock:
+                agent = self._agents.get(section.name)
+                if agent is None:
+                    model = agent_registry.model or agent_registry.default_agent.model
+                    agent = Agent(
+                        model,
+                        system_prompt=SECTION_SYSTEM_PROMPT,
+                        output_type=section.output_model,
+                        output_retries=SECTION_EXTRACTION_RETRIES
+                    )
+                    self._agents[section.name] = agent
+        return agent
+
+    async def _extract_section(self, section: Section, user_query: str, file_ids: List[str]) -> Tuple[Optional[Any], Dict[str, float]]:
+        async with _semaphore:
+            started = time.perf_counter()
+            chunks = await vector_store.asearch(section.query, k=SECTION_RETRIEVAL_K, file_ids=file_ids)
+            context = "\n".join(
+                f"\n--- Excerpt {i + 1} from {chunk.get('filename', 'Unknown File')} ---\n{chunk['text']}"
+                for i, chunk in enumerate(chunks)
+            )
+            prompt = (
+                f"Document excerpts:\n{context}\n\n"
+                f"User request: {user_query}\n\n"
+                f"Extract only the `{section.name}` section."
+            )
+            result = await self._get_agent(section).run(prompt)
+            output = result.output
+            print(f"Section '{section.name}' extracted in {time.perf_counter() - started:.2f}s ({len(chunks)} chunks)")
+
+        confidence = {}
+        for path, score in (output.confidence_report or {}).items():
+            # Paths are absolute in the merged report
+            if not path.startswith(f"{section.name}."):
+                path = f"{section.name}.{path}"
+            confidence[path] = score
+        return getattr(output, section.name), confidence
+
+    async def extract(self, user_query: str, file_ids: List[str]) -> BankingExtraction:
+        """
+        Wall-clock time approaches the slowest section (given enough concurrency).
+        A failed section is left null; if every section fails the error is raised.
+        """
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(self._extract_section(section, user_query, file_ids) for section in self.sections),
+            return_exceptions=True
+        )
+
+        data: Dict[str, Any] = {}
+        confidence_report: Dict[str, float] = {}
+        failures = []
+        for section, outcome in zip(self.sections, results):
+            if isinstance(outcome, BaseException):
+                if isinstance(outcome, asyncio.CancelledError):
+                    raise outcome
+                print(f"Section '{section.name}' extraction failed: {outcome}")
+                failures.append(outcome)
+                data[section.name] = None
+                continue
+            value, confidence = outcome
+            data[section.name] = value
+            confidence_report.update(confidence)
+
+        if len(failures) == len(self.sections):
+            raise failures[0]
+
+        data["confidence_report"] = confidence_report or None
+        extraction = BankingExtraction.model_validate(data)
+        print(
+            f"Section-wise extraction: {len(self.sections) - len(failures)}/{len(self.sections)} sections "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        return extraction
+
+
+# Singleton
+section_extractor = SectionExtractor()
@@ -0,0 +1,154 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import List, NamedTuple, Set
+from sqlalchemy import func, select, update
+from database import AsyncSessionLocal, Chat as ChatModel, Message as MessageModel
+from services.chat_history import HISTORY_TOKEN_BUDGET, count_tokens, row_tokens
+from services.agent_registry import agent_registry, SUMMARY
+
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+# Compact a chat once its unsummarized turns exceed this many tokens
+SUMMARY_TRIGGER_TOKENS = int(os.getenv("SUMMARY_TRIGGER_TOKENS", str(HISTORY_TOKEN_BUDGET)))
+# The newest turns worth this many tokens are always left verbatim
+SUMMARY_KEEP_TOKENS = int(os.getenv("SUMMARY_KEEP_TOKENS", str(HISTORY_TOKEN_BUDGET // 2)))
+# Turns folded into the summary per model call; a long backlog is worked through in several passes
+SUMMARY_BATCH_TOKENS = int(os.getenv("SUMMARY_BATCH_TOKENS", "6000"))
+# Length the summary is asked to stay under
+SUMMARY_TARGET_WORDS = int(os.getenv("SUMMARY_TARGET_WORDS", "400"))
+SUMMARY_MAX_ROWS = 200
+
+
+class _Row(NamedTuple):
+    role: str
+    content: str
+    tokens: int
+    created_at: datetime
+
+
+class ConversationSummarizer:
+    """
+    Folds a chat's oldest unsummarized turns into Chat.summary in the background.
+    Each pass extends the existing summary with the next batch of turns and moves
+    Chat.summary_through forward; the transcript is never re-summarized from scratch.
+    """
+
+    def __init__(self):
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def schedule(self, chat_id: str):
+        """
+        Start a background pass for the chat unless one is already running.
+        """
+        if not SUMMARY_ENABLED or chat_id in self._running:
+            return
+        self._running.add(chat_id)
+        task = asyncio.create_task(self._run(chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, chat_id: str):
+        try:
+            while await self.summarize_once(chat_id):
+                pass
+        except Exception as e:
+            print(f"Summarization failed for chat {chat_id}: {e}")
+        finally:
+            self._running.discard(chat_id)
+
+    async def aclose(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _select_batch(self, rows: List[_Row]) -> List[_Row]:
+        """
+        Oldest rows to fold: outside the verbatim tail, at most SUMMARY_BATCH_TOKENS,
+        ending on an assistant turn so the remaining history starts with the user.
+        """
+        keep, kept_tokens = 0, 0
+        for row in reversed(rows):
+            if kept_tokens + row.tokens > SUMMARY_KEEP_TOKENS:
+                break
+            kept_tokens += row.tokens
+            keep += 1
+        candidates = rows[:len(rows) - keep]
+
+        batch, batch_tokens = [], 0
+        for row in candidates:
+            if batch and batch_tokens + row.tokens > SUMMARY_BATCH_TOKENS:
+                break
+            batch.append(row)
+            batch_tokens += row.tokens
+        while batch and batch[-1].role != "assistant":
+            batch.pop()
+        return batch
+
+    async def summarize_once(self, chat_id: str) -> bool:
+        """
+        Fold one batch into the chat's summary. Returns True if the summary advanced.
+        """
+        async with AsyncSessionLocal() as db:
+            chat = await db.get(ChatModel, chat_id)
+            if chat is None:
+                return False
+            previous_summary, previous_through = chat.summary, chat.summary_through
+
+            stmt = select(
+                MessageModel.role, MessageModel.content, MessageModel.meta, MessageModel.created_at
+            ).where(MessageModel.chat_id == chat_id)
+            if previous_through is not None:
+                stmt = stmt.where(MessageModel.created_at > previous_through)
+            result = await db.execute(stmt.order_by(MessageModel.created_at).limit(SUMMARY_MAX_ROWS))
+            rows = [
+                _Row(role, content or "", row_tokens(content, meta), created_at)
+                for role, content, meta, created_at in result.all()
+            ]
+
+        if sum(row.tokens for row in rows) <= SUMMARY_TRIGGER_TOKENS:
+            return False
+        batch = self._select_batch(rows)
+        if not batch:
+            return False
+
+        # No DB connection is held while the model runs
+        transcript = "\n\n".join(f"{row.role.upper()}: {row.content}" for row in batch)
+        prompt = (
+            f"Current summary:\n{previous_summary or '(none yet)'}\n\n"
+            f"Next turns:\n{transcript}\n\n"
+            f"Return the updated summary, under {SUMMARY_TARGET_WORDS} words, "
+            "covering the current summary and these turns."
+        )
+        summary = (await agent_registry.get(SUMMARY).run(prompt)).output
+        if not isinstance(summary, str) or not summary.strip():
+            return False
+        summary = summary.strip()
+
+        folded_tokens = sum(row.tokens for row in batch)
+        # Only apply if nobody else moved the summary on while the model was running
+        unchanged = (
+            ChatModel.summary_through.is_(None) if previous_through is None
+            else ChatModel.summary_through == previous_through
+        )
+        async with AsyncSessionLocal() as db:
+            updated = await db.execute(
+                update(ChatModel)
+                .where(ChatModel.id == chat_id, unchanged)
+                .values(
+                    summary=summary,
+                    summary_through=batch[-1].created_at,
+                    summary_tokens=count_tokens(summary),
+                    summarized_messages=func.coalesce(ChatModel.summarized_messages, 0) + len(batch),
+                    summarized_tokens=func.coalesce(ChatModel.summarized_tokens, 0) + folded_tokens,
+                )
+            )
+            await db.commit()
+        if not updated.rowcount:
+            return False
+        print(f"Summarized {len(batch)} messages ({folded_tokens} tokens) of chat {chat_id}")
+        return True
+
+
+# Singleton
+conversation_summarizer = ConversationSummarizer()
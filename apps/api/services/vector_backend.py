@@ -0,0 +1,78 @@
+import asyncio
+from abc import ABC, abstractmethod
+from functools import partial
+from typing import Callable, Dict, List, Optional, Sequence
+
+EmbedFn = Callable[[List[str]], List[List[float]]]
+
+
+class VectorBackend(ABC):
+    """
+    Storage and nearest-neighbour search for document chunks. VectorStore owns the
+    embedding model and hands backends texts plus an embed function (so a backend
+    can skip texts it already has vectors for) and ready-made query vectors.
+    """
+
+    name: str = "base"
+
+    @abstractmethod
+    def add_documents(self, documents: List[Dict], embed_fn: EmbedFn) -> Dict:
+        """
+        Store chunks ('text' + 'metadata'). Returns counts: 'added', 'cache_hits', 'cache_misses'.
+        """
+
+    @abstractmethod
+    def search(
+        self,
+        query: str,
+        query_embedding: Sequence[float],
+        k: int,
+        file_ids: Optional[List[str]] = None,
+        chat_id: Optional[str] = None,
+        **options
+    ) -> List[Dict]:
+        """
+        Returns dicts with 'chunk_id', 'text', the chunk metadata and 'distance' or 'score'.
+        Options a backend doesn't understand are ignored.
+        """
+
+    async def asearch(
+        self,
+        query: str,
+        query_embedding: Sequence[float],
+        k: int,
+        file_ids: Optional[List[str]] = None,
+        chat_id: Optional[str] = None,
+        **options
+    ) -> List[Dict]:
+        """
+        search() for the event loop. Backends without a native async driver run it in a thread.
+        """
+        return await asyncio.to_thread(
+            partial(self.search, query, query_embedding, k, file_ids=file_ids, chat_id=chat_id, **options)
+        )
+
+    @abstractmethod
+    def delete_file(self, file_id: str) -> int:
+        ...
+
+    @abstractmethod
+    def assign_chat(self, file_ids: List[str], chat_id: str) -> int:
+        ...
+
+    def close(self):
+        """
+        Flush anything held in memory; called on shutdown.
+        """
+
+    def snapshot(self, path: str) -> str:
+        """
+        Write a consistent copy of the store to `path`. Returns the snapshot location.
+        """
+        raise NotImplementedError(f"{self.name} backend does not support snapshots")
+
+    def restore(self, path: str):
+        """
+        Replace the store's contents with a snapshot written by snapshot().
+        """
+        raise NotImplementedError(f"{self.name} backend does not support snapshots")
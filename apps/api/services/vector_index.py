@@ -0,0 +1,208 @@
+import os
+from typing import Dict, List, Optional
+from sqlalchemy import text, cast, func, bindparam
+from pgvector.sqlalchemy import Vector, HALFVEC, BIT
+from database import engine, DocumentChunk
+
+# ANN index on document_chunks.embedding: hnsw, ivfflat or none (sequential scan)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+# Distance used by search; the index operator class must match it to be usable
+VECTOR_METRIC = os.getenv("VECTOR_METRIC", "l2")
+# Compressed representation for a two-stage search: none, halfvec (fp16) or binary (1 bit/dim).
+# Candidates come from an expression index over the compressed form and are re-ranked
+# exactly against the full-precision column.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+# Candidates fetched from the compressed index per requested result; higher = better recall, slower
+QUANTIZED_OVERSAMPLE = int(os.getenv("QUANTIZED_OVERSAMPLE", "4"))
+DIMENSION = 384
+# Build-time parameters
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+# Query-time defaults (overridable per search() call)
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "1"))
+# pgvector >= 0.8: keep scanning the HNSW graph when filters discard candidates
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN", "relaxed_order")
+
+METRICS = {
+    "l2": {"ops": "l2_ops", "distance": "l2_distance"},
+    "cosine": {"ops": "cosine_ops", "distance": "cosine_distance"},
+    "inner_product": {"ops": "ip_ops", "distance": "max_inner_product"},
+}
+
+
+def distance(query_embedding, metric: str = VECTOR_METRIC):
+    """
+    Full-precision distance expression for ORDER BY; smaller is closer for every metric.
+    """
+    return getattr(DocumentChunk.embedding, METRICS[metric]["distance"])(query_embedding)
+
+
+def quantized_distance(query_embedding, metric: str = VECTOR_METRIC, quantization: str = VECTOR_QUANTIZATION):
+    """
+    Distance over the compressed representation. Must match the expression in
+    index_target() exactly for Postgres to use the index.
+    """
+    query = cast(bindparam("query_embedding", query_embedding, type_=Vector(DIMENSION)), Vector(DIMENSION))
+    if quantization == "halfvec":
+        column = cast(DocumentChunk.embedding, HALFVEC(DIMENSION))
+        return getattr(column, METRICS[metric]["distance"])(cast(query, HALFVEC(DIMENSION)))
+    if quantization == "binary":
+        # Hamming distance between sign bits; only meaningful as a coarse first stage
+        column = cast(func.binary_quantize(DocumentChunk.embedding), BIT(DIMENSION))
+        return column.hamming_distance(func.binary_quantize(query))
+    raise ValueError(f"Unknown vector quantization: {quantization}")
+
+
+def index_target(metric: str, quantization: str) -> str:
+    if quantization == "halfvec":
+        return f"(embedding::halfvec({DIMENSION})) halfvec_{METRICS[metric]['ops']}"
+    if quantization == "binary":
+        return f"(binary_quantize(embedding)::bit({DIMENSION})) bit_hamming_ops"
+    return f"embedding vector_{METRICS[metric]['ops']}"
+
+
+def index_name(kind: str, metric: str, quantization: str = "none") -> str:
+    name = f"ix_document_chunks_embedding_{kind}_{metric}"
+    if quantization == "binary":
+        return f"ix_document_chunks_embedding_{kind}_binary"
+    if quantization != "none":
+        name += f"_{quantization}"
+    return name
+
+
+def create_index_sql(
+    kind: str = VECTOR_INDEX_TYPE,
+    metric: str = VECTOR_METRIC,
+    quantization: str = VECTOR_QUANTIZATION,
+    concurrently: bool = True
+) -> str:
+    if kind == "hnsw":
+        params = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+    elif kind == "ivfflat":
+        params = f"lists = {IVFFLAT_LISTS}"
+    else:
+        raise ValueError(f"Unknown vector index type: {kind}")
+
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {index_name(kind, metric, quantization)} "
+        f"ON document_chunks USING {kind} ({index_target(metric, quantization)}) WITH ({params})"
+    )
+
+
+def search_settings_statement(ef_search: Optional[int] = None, probes: Optional[int] = None, filtered: bool = False):
+    """
+    Per-query ANN knobs in a single round trip, scoped to the current transaction
+    (set_config(..., true) == SET LOCAL).
+    """
+    settings = {
+        "hnsw.ef_search": str(ef_search or HNSW_EF_SEARCH),
+        "ivfflat.probes": str(probes or IVFFLAT_PROBES),
+    }
+    if filtered and HNSW_ITERATIVE_SCAN:
+        settings["hnsw.iterative_scan"] = HNSW_ITERATIVE_SCAN
+    calls = ", ".join(f"set_config(:name_{i}, :value_{i}, true)" for i in range(len(settings)))
+    params = {}
+    for i, (name, value) in enumerate(settings.items()):
+        params[f"name_{i}"] = name
+        params[f"value_{i}"] = value
+    return text(f"SELECT {calls}"), params
+
+
+def apply_search_settings(db, ef_search: Optional[int] = None, probes: Optional[int] = None, filtered: bool = False):
+    db.execute(*search_settings_statement(ef_search, probes, filtered))
+
+
+async def apply_search_settings_async(db, ef_search: Optional[int] = None, probes: Optional[int] = None, filtered: bool = False):
+    await db.execute(*search_settings_statement(ef_search, probes, filtered))
+
+
+def build_index(kind: str = VECTOR_INDEX_TYPE, metric: str = VECTOR_METRIC, quantization: str = VECTOR_QUANTIZATION):
+    """
+    Build the ANN index with CREATE INDEX CONCURRENTLY, so ingestion and search keep running.
+    A previous interrupted concurrent build leaves an INVALID index behind; it is dropped first.
+    An index that is still being built is also INVALID, so builds take an advisory lock on
+    the index name: a second API worker (or the admin script) skips instead of dropping it.
+    Returns False if another process holds the lock.
+    """
+    name = index_name(kind, metric, quantization)
+    # CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # try_ rather than a blocking wait: a session parked in pg_advisory_lock holds a
+        # snapshot that the concurrent build would in turn wait for
+        locked = conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:name))"), {"name": name}).scalar()
+        if not locked:
+            print(f"Index {name} is being built by another process; skipping.")
+            return False
+        try:
+            invalid = conn.execute(text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ), {"name": name}).first()
+            if invalid:
+                print(f"Dropping invalid index {name} left by an interrupted build.")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+            print(f"Building {kind} index {name} ({index_target(metric, quantization)})...")
+            conn.execute(text(create_index_sql(kind, metric, quantization)))
+            print(f"Index {name} ready.")
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(hashtext(:name))"), {"name": name})
+    return True
+
+
+def drop_index(kind: str = VECTOR_INDEX_TYPE, metric: str = VECTOR_METRIC, quantization: str = VECTOR_QUANTIZATION):
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name(kind, metric, quantization)}"))
+
+
+def ensure_index():
+    """
+    Startup hook: build the configured index if it's missing. IVFFlat needs data to
+    train its lists, so it's left to the admin command until the table has enough rows.
+    """
+    if VECTOR_INDEX_TYPE == "none":
+        return
+    if VECTOR_INDEX_TYPE == "ivfflat":
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT count(*) FROM document_chunks")).scalar()
+        if rows < IVFFLAT_LISTS * 10:
+            print(f"Skipping IVFFlat build: {rows} rows is too few to train {IVFFLAT_LISTS} lists.")
+            return
+    try:
+        build_index()
+    except Exception as e:
+        print(f"Vector index build failed: {e}")
+
+
+def index_status() -> List[Dict]:
+    """
+    Existing indexes on document_chunks.embedding with their size and validity.
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT c.relname AS name, pg_get_indexdef(c.oid) AS definition, "
+            "pg_size_pretty(pg_relation_size(c.oid)) AS size, i.indisvalid AS valid "
+            "FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid "
+            "JOIN pg_class t ON t.oid = i.indrelid "
+            "JOIN pg_am am ON am.oid = c.relam "
+            "WHERE t.relname = 'document_chunks' AND am.amname IN ('hnsw', 'ivfflat')"
+        )).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def build_progress() -> List[Dict]:
+    """
+    In-flight index builds on document_chunks, from pg_stat_progress_create_index.
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT p.pid, c.relname AS index_name, p.command, p.phase, "
+            "p.blocks_done, p.blocks_total, p.tuples_done, p.tuples_total "
+            "FROM pg_stat_progress_create_index p "
+            "LEFT JOIN pg_class c ON c.oid = p.index_relid "
+            "WHERE p.relid = 'document_chunks'::regclass"
+        )).mappings().all()
+    return [dict(r) for r in rows]
@@ -1,74 +1,177 @@
-from typing import List, Dict
-from sqlalchemy import select
-from langchain_huggingface import HuggingFaceEmbeddings
-from database import SessionLocal, DocumentChunk
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+from services.embeddings import EmbeddingBackend, create_embedding_backend
+from services.vector_backend import VectorBackend
+from services.pgvector_backend import PgVectorBackend
+from services.search_cache import SearchCache
+
+# Where chunks are stored and searched: 'pgvector' (Postgres) or 'local' (in-process HNSW on disk)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pgvector")
+# Threads that embed queries for asearch(), off the event loop and apart from the request threadpool
+QUERY_EMBEDDING_WORKERS = int(os.getenv("QUERY_EMBEDDING_WORKERS", "2"))
+
+
+def create_vector_backend(name: str, model_name: str, dimension: int) -> VectorBackend:
+    if name == "pgvector":
+        return PgVectorBackend(model_name)
+    if name == "local":
+        # hnswlib is only needed for edge / single-tenant installs
+        from services.local_ann_backend import LocalAnnBackend
+        return LocalAnnBackend(model_name, dimension)
+    raise ValueError(f"Unknown vector backend: {name}")
+
 
 class VectorStore:
-    def __init__(self, dimension=384):
+    def __init__(
+        self,
+        dimension=384,
+        embedding_backend: Optional[EmbeddingBackend] = None,
+        backend: Optional[VectorBackend] = None
+    ):
         self.dimension = dimension
-        # Initialize embedding model locally
+        # Initialize embedding model locally (EMBEDDING_BACKEND selects PyTorch or quantized ONNX)
         # Using all-MiniLM-L6-v2 which creates 384-dim embeddings
-        self.embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+        self.embedding_model = embedding_backend or create_embedding_backend()
+        if self.embedding_model.dimension != dimension:
+            raise ValueError(f"Embedding backend produces {self.embedding_model.dimension}-dim vectors, expected {dimension}")
+        self.model_name = self.embedding_model.model_name
+        self.backend = backend or create_vector_backend(VECTOR_BACKEND, self.model_name, dimension)
+        # Writes from another process (scripts/ingestion_worker.py) don't invalidate this
+        # process's result cache; SEARCH_RESULT_CACHE_TTL bounds how stale it can get
+        self.search_cache = SearchCache()
+        self._query_executor = ThreadPoolExecutor(max_workers=QUERY_EMBEDDING_WORKERS, thread_name_prefix="query-embedding")
 
-    def add_documents(self, documents: List[Dict]):
+    def add_documents(self, documents: List[Dict]) -> Dict:
         """
         Add documents to the store.
         documents: List of dicts, each must have 'text' and 'metadata'.
+        'file_id' and 'chat_id' in metadata are used to scope searches.
+        Returns counts: 'added', 'cache_hits', 'cache_misses'.
         """
-        if not documents:
-            return
-
-        texts = [doc['text'] for doc in documents]
-        # Generate embeddings using the local model
-        embeddings = self.embedding_model.embed_documents(texts)
-        
-        db = SessionLocal()
         try:
-            chunks = []
-            for i, doc in enumerate(documents):
-                chunk = DocumentChunk(
-                    text=doc['text'],
-                    metadata_=doc.get('metadata', {}),
-                    embedding=embeddings[i]
-                )
-                chunks.append(chunk)
-            
-            db.add_all(chunks)
-            db.commit()
-            print(f"Added {len(chunks)} documents to Postgres vector store.")
-        except Exception as e:
-            print(f"Error adding documents: {e}")
-            db.rollback()
+            return self.backend.add_documents(documents, self.embedding_model.embed_documents)
         finally:
-            db.close()
+            metadata = [doc.get('metadata', {}) for doc in documents]
+            self.search_cache.invalidate(
+                {m.get('file_id') for m in metadata},
+                {m.get('chat_id') for m in metadata}
+            )
 
-    def search(self, query: str, k: int = 5) -> List[Dict]:
+    def delete_file(self, file_id: str) -> int:
         """
-        Search for most similar documents.
-        Returns list of dicts with 'text', 'metadata', and 'score'.
+        Remove every chunk indexed for a file. Returns the number of deleted chunks.
         """
-        # Generate query embedding
-        query_embedding = self.embedding_model.embed_query(query)
-        
-        db = SessionLocal()
         try:
-            # L2 distance (Euclidean distance) -> smaller is better
-            stmt = select(DocumentChunk).order_by(
-                DocumentChunk.embedding.l2_distance(query_embedding)
-            ).limit(k)
-            
-            results = db.execute(stmt).scalars().all()
-            
-            output = []
-            for chunk in results:
-                output.append({
-                    "text": chunk.text,
-                    **chunk.metadata_
-                })
-            
-            return output
+            return self.backend.delete_file(file_id)
         finally:
-            db.close()
+            self.search_cache.invalidate([file_id])
+
+    def assign_chat(self, file_ids: List[str], chat_id: str) -> int:
+        """
+        Tag chunks of files that were uploaded before their chat existed.
+        """
+        try:
+            return self.backend.assign_chat(file_ids, chat_id)
+        finally:
+            self.search_cache.invalidate(file_ids, [chat_id])
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        file_ids: Optional[List[str]] = None,
+        chat_id: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        mode: Optional[str] = None,
+        oversample: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Search for most similar documents.
+        file_ids / chat_id restrict the search to chunks of those files / that chat.
+        ef_search (HNSW) / probes (IVFFlat) trade recall for latency; defaults come from settings.
+        mode: 'vector' or 'hybrid' (vector + full-text with rank fusion); defaults to SEARCH_MODE.
+        oversample: candidates per result taken from the quantized index before exact re-ranking.
+        Options the configured backend doesn't support are ignored.
+        Repeated queries are served from the query-embedding and result caches.
+        Returns list of dicts with 'chunk_id', 'text', the chunk metadata, and
+        'distance' (vector mode, smaller is better) or 'score' (hybrid mode, larger is better).
+        """
+        scope = SearchCache.scope(file_ids, chat_id)
+        key = self.search_cache.result_key(query, scope, k, (ef_search, probes, mode, oversample))
+        cached, generation = self.search_cache.get_results(key)
+        if cached is not None:
+            return cached
+
+        # Generate query embedding
+        query_embedding = self.search_cache.query_embedding(query, self.embedding_model.embed_query)
+        results = self.backend.search(
+            query,
+            query_embedding,
+            k,
+            file_ids=file_ids,
+            chat_id=chat_id,
+            ef_search=ef_search,
+            probes=probes,
+            mode=mode,
+            oversample=oversample
+        )
+        self.search_cache.put_results(key, results, generation)
+        return results
+
+    async def asearch(
+        self,
+        query: str,
+        k: int = 5,
+        file_ids: Optional[List[str]] = None,
+        chat_id: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        mode: Optional[str] = None,
+        oversample: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        search() for async request handlers: cache hits return without leaving the loop,
+        query embedding runs on a dedicated executor and the backend query is awaited.
+        """
+        scope = SearchCache.scope(file_ids, chat_id)
+        key = self.search_cache.result_key(query, scope, k, (ef_search, probes, mode, oversample))
+        cached, generation = self.search_cache.get_results(key)
+        if cached is not None:
+            return cached
+
+        query_embedding = self.search_cache.cached_query_embedding(query)
+        if query_embedding is None:
+            loop = asyncio.get_running_loop()
+            query_embedding = await loop.run_in_executor(self._query_executor, self.embedding_model.embed_query, query)
+            self.search_cache.store_query_embedding(query, query_embedding)
+
+        results = await self.backend.asearch(
+            query,
+            query_embedding,
+            k,
+            file_ids=file_ids,
+            chat_id=chat_id,
+            ef_search=ef_search,
+            probes=probes,
+            mode=mode,
+            oversample=oversample
+        )
+        self.search_cache.put_results(key, results, generation)
+        return results
+
+    def snapshot(self, path: str) -> str:
+        return self.backend.snapshot(path)
+
+    def restore(self, path: str):
+        self.backend.restore(path)
+        self.search_cache.clear()
+
+    def close(self):
+        self._query_executor.shutdown(wait=False)
+        self.backend.close()
 
 # Singleton
 vector_store = VectorStore()
@@ -0,0 +1,32 @@
+from services.chat_history import window
+
+
+def test_window_keeps_newest_rows_within_budget():
+    rows = [("user", "q1", 10), ("assistant", "a1", 10), ("user", "q2", 10), ("assistant", "a2", 10)]
+
+    assert window(rows, budget=20) == rows[2:]
+
+
+def test_window_never_starts_on_assistant_turn():
+    rows = [("user", "q1", 10), ("assistant", "a1", 10), ("user", "q2", 10), ("assistant", "a2", 10)]
+
+    # 30 tokens fit a1, q2 and a2; the orphaned a1 is dropped
+    kept = window(rows, budget=30)
+
+    assert kept == rows[2:]
+    assert kept[0][0] == "user"
+
+
+def test_window_skips_leading_non_user_rows_at_any_budget():
+    rows = [("assistant", "a0", 5), ("system", "note", 5), ("user", "q1", 5), ("assistant", "a1", 5)]
+
+    for budget in range(0, 25):
+        kept = window(rows, budget)
+        assert not kept or kept[0][0] == "user"
+        assert sum(row[2] for row in kept) <= budget
+
+
+def test_window_empty_when_newest_row_exceeds_budget():
+    rows = [("user", "q1", 5), ("assistant", "a1", 50)]
+
+    assert window(rows, budget=10) == []
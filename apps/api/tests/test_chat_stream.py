@@ -0,0 +1,84 @@
+import asyncio
+import json
+from services.chat_stream import ChatStream, ContentEncoder, END_EVENT
+
+
+def parse(raw: str):
+    """
+    (event id, data payload or the raw event) for one buffered SSE event.
+    """
+    head, _, rest = raw.partition("\n")
+    event_id = int(head[len("id: "):])
+    if rest.startswith("data: "):
+        return event_id, json.loads(rest[len("data: "):])
+    return event_id, rest
+
+
+async def collect(stream: ChatStream, last_event_id: int):
+    return [parse(event) async for event in stream.follow(last_event_id)]
+
+
+def make_stream(mode: str, words, replay_events: int) -> ChatStream:
+    async def build():
+        stream = ChatStream("s", "c", ContentEncoder(mode), replay_events=replay_events)
+        for word in words:
+            await stream.publish(stream.encoder.delta(word))
+        await stream.finish()
+        return stream
+    return asyncio.run(build())
+
+
+def test_delta_replay_after_eviction_resyncs_missed_text():
+    words = ["one ", "two ", "three ", "four ", "five "]
+    stream = make_stream("delta", words, replay_events=2)
+
+    # The client saw event 1; events 2 and 3 have been evicted
+    events = asyncio.run(collect(stream, 1))
+
+    assert events[0] == (3, {"type": "snapshot", "content": "one two three "})
+    assert events[1:] == [
+        (4, {"type": "content", "delta": "four "}),
+        (5, {"type": "content", "delta": "five "}),
+    ]
+
+
+def test_snapshot_replay_after_eviction_carries_full_text():
+    words = ["a", "b", "c", "d"]
+    stream = make_stream("snapshot", words, replay_events=2)
+
+    events = asyncio.run(collect(stream, 0))
+
+    assert [event_id for event_id, _ in events] == [2, 3, 4]
+    assert events[0][1]["content"] == "ab"
+    assert [payload["content"] for _, payload in events[1:]] == ["abc", "abcd"]
+
+
+def test_resume_inside_buffer_replays_only_newer_events():
+    stream = make_stream("delta", ["x", "y", "z"], replay_events=10)
+
+    events = asyncio.run(collect(stream, 2))
+
+    assert events == [(3, {"type": "content", "delta": "z"})]
+
+
+def test_follow_waits_for_live_events():
+    async def run():
+        stream = ChatStream("s", "c", ContentEncoder("delta"))
+        follower = asyncio.create_task(collect(stream, 0))
+        await asyncio.sleep(0)
+        await stream.publish(stream.encoder.delta("hi"))
+        await stream.publish(END_EVENT)
+        await stream.finish()
+        return await follower
+
+    events = asyncio.run(run())
+
+    assert events == [(1, {"type": "content", "delta": "hi"}), (2, "event: end\ndata: \n\n")]
+
+
+def test_follow_completes_without_replay_buffer():
+    stream = make_stream("delta", ["x", "y", "z"], replay_events=0)
+
+    events = asyncio.run(asyncio.wait_for(collect(stream, 0), timeout=1))
+
+    assert events == [(2, {"type": "snapshot", "content": "xy"}), (3, {"type": "content", "delta": "z"})]
@@ -0,0 +1,52 @@
+from services.search_cache import SearchCache
+
+
+def make_key(cache: SearchCache, file_ids=("a",), chat_id=None):
+    return cache.result_key("revenue in 2023", SearchCache.scope(file_ids, chat_id), 5, ())
+
+
+def test_put_after_invalidate_is_dropped():
+    cache = SearchCache()
+    key = make_key(cache)
+
+    # A search misses, then a write to its files lands before it stores its results
+    results, generation = cache.get_results(key)
+    assert results is None
+    cache.invalidate(["a"])
+    cache.put_results(key, [{"chunk_id": 1, "text": "stale"}], generation)
+
+    assert cache.get_results(key)[0] is None
+
+
+def test_put_with_current_generation_is_cached():
+    cache = SearchCache()
+    key = make_key(cache)
+
+    _, generation = cache.get_results(key)
+    cache.put_results(key, [{"chunk_id": 1, "text": "fresh"}], generation)
+
+    assert cache.get_results(key)[0] == [{"chunk_id": 1, "text": "fresh"}]
+
+
+def test_invalidate_only_evicts_overlapping_scopes():
+    cache = SearchCache()
+    key_a, key_b = make_key(cache, ("a",)), make_key(cache, ("b",))
+    for key in (key_a, key_b):
+        _, generation = cache.get_results(key)
+        cache.put_results(key, [{"chunk_id": 1}], generation)
+
+    cache.invalidate(["a"])
+
+    assert cache.get_results(key_a)[0] is None
+    assert cache.get_results(key_b)[0] == [{"chunk_id": 1}]
+
+
+def test_cached_results_are_copies():
+    cache = SearchCache()
+    key = make_key(cache)
+    _, generation = cache.get_results(key)
+    cache.put_results(key, [{"chunk_id": 1}], generation)
+
+    cache.get_results(key)[0][0]["score"] = 0.9
+
+    assert cache.get_results(key)[0] == [{"chunk_id": 1}]
@@ -48,13 +48,18 @@ export function ChatInterface({ chatId, initialMessages: propInitialMessages }:
         chatIdRef.current = currentChatId;
     }, [currentChatId]);
 
+    const sseConnection = fetchServerSentEvents("/api/chat", () => ({
+        body: {
+            industry: industryRef.current,
+            chat_id: chatIdRef.current
+        }
+    }));
+
     const { messages, sendMessage, isLoading, setMessages } = useChat({
-        connection: fetchServerSentEvents("/api/chat", () => ({
-            body: {
-                industry: industryRef.current,
-                chat_id: chatIdRef.current
-            }
-        })),
+        // The server loads earlier turns from chat_id, so only the new message is posted
+        connection: {
+            connect: (messages, data, abortSignal) => sseConnection.connect(messages.slice(-1), data, abortSignal)
+        },
         initialMessages: propInitialMessages || fetchedMessages || [
             {
                 id: "1",
@@ -105,7 +110,19 @@ export function ChatInterface({ chatId, initialMessages: propInitialMessages }:
                 body: formData,
             });
             if (!res.ok) throw new Error("Upload failed");
-            return res.json();
+            const uploaded = await res.json();
+
+            // Indexing runs in the background; wait until the file is searchable
+            // so the first question about it has context.
+            let status = uploaded.status;
+            while (status === "queued" || status === "extracting" || status === "embedding") {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const statusRes = await fetch(`/api/files/${uploaded.id}/status`);
+                if (!statusRes.ok) break;
+                status = (await statusRes.json()).status;
+            }
+            if (status === "failed") console.error(`Indexing failed for ${uploaded.filename}`);
+            return uploaded;
         }
     });
 